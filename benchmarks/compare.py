@@ -0,0 +1,56 @@
+"""
+Compares two result files of benchmarks.suite and reports the benchmarks which got slower or use more memory.
+
+    python -m benchmarks.compare base.json head.json --threshold 0.1
+
+Exits with status 1 when a benchmark regressed by more than the threshold (a relative change, 0.1 is 10%).
+"""
+import argparse
+import json
+import sys
+
+
+def compare(base, head, threshold=0.1):
+    """
+    Parameters:
+        base <dict>: The reference results of benchmarks.suite.run.
+        head <dict>: The compared results of benchmarks.suite.run.
+        threshold <float>: The relative change of min_seconds or peak_memory_bytes considered a regression.
+    Returns:
+        <list>: (name, base seconds, head seconds, time change, base bytes, head bytes, memory change, regressed)
+                of every benchmark found in both results.
+    """
+    rows = []
+    for name, head_result in head['results'].items():
+        base_result = base['results'].get(name)
+        if base_result is None:
+            continue
+        time_change = head_result['min_seconds'] / base_result['min_seconds'] - 1 \
+            if base_result['min_seconds'] else 0.0
+        memory_change = head_result['peak_memory_bytes'] / base_result['peak_memory_bytes'] - 1 \
+            if base_result['peak_memory_bytes'] else 0.0
+        rows.append((name, base_result['min_seconds'], head_result['min_seconds'], time_change,
+                     base_result['peak_memory_bytes'], head_result['peak_memory_bytes'], memory_change,
+                     time_change > threshold or memory_change > threshold))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    print(f"base {base['meta']['commit']}, head {head['meta']['commit']}")
+    print(f"{'benchmark':<48} {'base ms':>10} {'head ms':>10} {'time':>8} {'base MiB':>10} {'head MiB':>10} "
+          f"{'memory':>8}")
+    rows = compare(base, head, args.threshold)
+    for name, base_s, head_s, time_change, base_b, head_b, memory_change, regressed in rows:
+        print(f"{name:<48} {base_s * 1000:10.2f} {head_s * 1000:10.2f} {time_change:+8.1%} "
+              f"{base_b / 1024 ** 2:10.2f} {head_b / 1024 ** 2:10.2f} {memory_change:+8.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    sys.exit(1 if any(row[-1] for row in rows) else 0)
@@ -0,0 +1,51 @@
+"""
+Compares the accuracy and speed of the skew estimators of mlutils.image.cv_helper on synthetic text images.
+
+    python -m benchmarks.skew
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from mlutils.image import cv_helper
+from mlutils.image.cv_helper import estimate_skew_angle, fix_skew
+
+exhaustive_skew_angle = getattr(cv_helper, '__calculate_skew_angel')
+
+
+def make_text_image(width=1200, height=800, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y in range(60, height - 20, 45):
+        words = ' '.join(''.join(rng.choice(list('abcdefghijklmnopqrstuvwxyz'), rng.integers(2, 9)))
+                         for _ in range(8))
+        cv2.putText(image, words, (20, y), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+    return image
+
+
+def run(samples=20, limit=40, seed=0):
+    rng = np.random.default_rng(seed)
+    estimators = {'exhaustive': exhaustive_skew_angle, 'coarse_to_fine': estimate_skew_angle}
+    results = {name: {'seconds': 0.0, 'errors': []} for name in estimators}
+    for i in range(samples):
+        angle = float(rng.uniform(-limit, limit))
+        image = fix_skew(make_text_image(seed=i), angle)
+        for name, estimator in estimators.items():
+            start = time.perf_counter()
+            estimated = estimator(image)
+            results[name]['seconds'] += time.perf_counter() - start
+            # the estimators return the correction angle
+            results[name]['errors'].append(abs(estimated + angle))
+    return {name: {'mean_seconds': x['seconds'] / samples, 'mean_abs_error': float(np.mean(x['errors'])),
+                   'max_abs_error': float(np.max(x['errors']))} for name, x in results.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+    for name, result in run(args.samples).items():
+        print(f"{name:>15}: {result['mean_seconds'] * 1000:8.1f} ms/image, "
+              f"mean error {result['mean_abs_error']:.2f} deg, max error {result['max_abs_error']:.2f} deg")
@@ -0,0 +1,381 @@
+"""
+Measures the time and peak memory of the hot paths of mlutils on synthetic data and writes the results as JSON,
+which benchmarks.compare diffs between two runs (e.g. two commits).
+
+    python -m benchmarks.suite --output base.json
+    python -m benchmarks.suite --output head.json --filter pdf --scale large
+    python -m benchmarks.compare base.json head.json
+
+Every benchmark prepares its data outside of the measurement. It is run once to warm up, then repeat times for the
+timings, then once more under tracemalloc for the peak of the memory allocated by Python and NumPy (memory allocated
+by native libraries such as OpenCV or MuPDF is not traced).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks import synthetic
+from benchmarks.skew import make_text_image, exhaustive_skew_angle
+
+SCALES = {
+    'small': {'pages': 10, 'documents': 4, 'images': 50, 'boxes': 300, 'labels': 500, 'split_items': 100_000},
+    'large': {'pages': 100, 'documents': 16, 'images': 500, 'boxes': 3000, 'labels': 5000, 'split_items': 5_000_000},
+}
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function receives a working directory and the parameters of the scale, it
+    prepares the data and returns the function to be measured, or a (function, reset) tuple where reset is called
+    before every run without being measured.
+    """
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def measure(func, reset=None, repeat=5):
+    """
+    Returns:
+        <dict>: min, mean and max seconds of repeat runs and peak_memory_bytes of one traced run.
+    """
+    def call():
+        if reset:
+            reset()
+        start = time.perf_counter()
+        # the printed output of some functions (summaries, progress bars) is not part of the measurement
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            func()
+        return time.perf_counter() - start
+
+    call()
+    seconds = [call() for _ in range(repeat)]
+    if reset:
+        reset()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'min_seconds': min(seconds), 'mean_seconds': sum(seconds) / len(seconds), 'max_seconds': max(seconds),
+            'runs': repeat, 'peak_memory_bytes': peak}
+
+
+def _remove(*paths):
+    def reset():
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+    return reset
+
+
+@benchmark('pdf.PDFHelper')
+def _pdf_helper(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    path = synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages'])
+    return lambda: PDFHelper(path)
+
+
+@benchmark('pdf.PDFHelper.lazy')
+def _pdf_helper_lazy(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    path = synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages'])
+    return lambda: PDFHelper(path, lazy=True).get_attributes_by_page(0)
+
+
+@benchmark('pdf.PDFHelper.cache')
+def _pdf_helper_cache(workdir, scale):
+    from mlutils.pdf.cache import PDFCache
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    path = synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages'])
+    cache = PDFCache(os.path.join(workdir, 'pdf_cache'))
+    PDFHelper(path, cache=cache)
+    return lambda: PDFHelper(path, cache=cache)
+
+
+@benchmark('pdf.find_pages_by_texts')
+def _pdf_find_pages(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    pdf = PDFHelper(synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages']))
+    texts = [text for text, _, _ in pdf.metadata[::7]]
+    return lambda: (pdf.find_pages_by_texts(texts), pdf.get_bboxes_by_texts(texts))
+
+
+@benchmark('pdf.extract_documents')
+def _pdf_extract_documents(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import extract_documents
+    paths = [synthetic.make_pdf(os.path.join(workdir, f'document_{i}.pdf'), scale['pages'], seed=i)
+             for i in range(scale['documents'])]
+    return lambda: extract_documents(paths, workers=2, images=False)
+
+
+@benchmark('pdf.PDFHelper.render_pages')
+def _pdf_render_pages(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    path = synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages'])
+    # a new instance renders every page again instead of hitting its render cache
+    return lambda: PDFHelper(path, lazy=True).render_pages(dpi=100, workers=2)
+
+
+@benchmark('pdf.PDFHelper.render_page.clip')
+def _pdf_render_page_clip(workdir, scale):
+    from mlutils.pdf.digital_pdf_helper import PDFHelper
+    path = synthetic.make_pdf(os.path.join(workdir, 'document.pdf'), scale['pages'])
+    return lambda: [PDFHelper(path, lazy=True).render_page(0, dpi=300, clip=(50, 50, 250, 150)) for _ in range(10)]
+
+
+@benchmark('image.calculate_iou')
+def _calculate_iou(workdir, scale):
+    from mlutils.image.cv_helper import calculate_iou
+    boxes = synthetic.make_boxes(scale['boxes']).tolist()
+    return lambda: [calculate_iou(boxes[0], box) for box in boxes]
+
+
+@benchmark('image.calculate_iou_matrix')
+def _calculate_iou_matrix(workdir, scale):
+    from mlutils.image.cv_helper import calculate_iou_matrix
+    boxes = synthetic.make_boxes(scale['boxes'])
+    return lambda: calculate_iou_matrix(boxes, boxes)
+
+
+@benchmark('image.non_max_suppression')
+def _non_max_suppression(workdir, scale):
+    from mlutils.image.cv_helper import non_max_suppression
+    boxes = synthetic.make_boxes(scale['boxes'])
+    scores = np.random.default_rng(0).random(len(boxes))
+    return lambda: non_max_suppression(boxes, scores)
+
+
+@benchmark('image.match_boxes')
+def _match_boxes(workdir, scale):
+    from mlutils.image.cv_helper import match_boxes
+    boxes = synthetic.make_boxes(scale['boxes'])
+    predictions = boxes + np.random.default_rng(1).normal(0, 2, boxes.shape)
+    return lambda: match_boxes(predictions, boxes, method='hungarian')
+
+
+@benchmark('image.get_objects')
+def _get_objects(workdir, scale):
+    from mlutils.image.cv_helper import get_objects
+    image = synthetic.make_image(1000, 1000)
+    boxes = synthetic.make_boxes(scale['boxes'])
+    return lambda: get_objects(image, boxes, pack=True)
+
+
+@benchmark('image.estimate_skew_angle')
+def _estimate_skew_angle(workdir, scale):
+    from mlutils.image.cv_helper import estimate_skew_angle, fix_skew
+    image = fix_skew(make_text_image(), 12.3)
+    return lambda: estimate_skew_angle(image)
+
+
+@benchmark('image.estimate_skew_angle.exhaustive')
+def _exhaustive_skew_angle(workdir, scale):
+    from mlutils.image.cv_helper import fix_skew
+    image = fix_skew(make_text_image(), 12.3)
+    return lambda: exhaustive_skew_angle(image)
+
+
+@benchmark('image.TemplateBank')
+def _template_bank(workdir, scale):
+    from mlutils.image.cv_helper import TemplateBank
+    image = synthetic.make_image(800, 600)
+    templates = {i: synthetic.make_image(120, 60, seed=i) for i in range(20)}
+    bank = TemplateBank(templates, workers=4)
+    return lambda: bank.match(image)
+
+
+@benchmark('image.get_image_size')
+def _get_image_size(workdir, scale):
+    from mlutils.image.utils import get_image_size
+    path = os.path.join(workdir, 'images')
+    files = [os.path.join(path, file) for file in synthetic.make_image_folder(path, scale['images'])]
+    return lambda: [get_image_size(file) for file in files]
+
+
+@benchmark('data.filter_images_by_dimension')
+def _filter_images_by_dimension(workdir, scale):
+    from mlutils.data.filter import filter_images_by_dimension
+    source_path, target_path = os.path.join(workdir, 'images'), os.path.join(workdir, 'filtered')
+    synthetic.make_image_folder(source_path, scale['images'])
+    return lambda: filter_images_by_dimension(source_path, target_path, 320, 320), _remove(target_path)
+
+
+@benchmark('data.find_duplicates')
+def _find_duplicates(workdir, scale):
+    from mlutils.data.dedup import find_duplicates
+    source_path = os.path.join(workdir, 'images')
+    paths = [os.path.join(source_path, file) for file in synthetic.make_image_folder(source_path, scale['images'])]
+    return lambda: find_duplicates(paths)
+
+
+@benchmark('data.read_label_dir')
+def _read_label_dir(workdir, scale):
+    from mlutils.data.labels import read_label_dir
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['labels'], image_size=(16, 16))
+    return lambda: read_label_dir(dataset['labels'])
+
+
+@benchmark('data.split_indices')
+def _split_indices(workdir, scale):
+    from mlutils.data.splitting import split_indices
+    labels = np.random.default_rng(0).integers(0, 20, scale['split_items'])
+    return lambda: split_indices(len(labels), 0.7, 0.2, 0.1, seed=0, stratify=labels)
+
+
+@benchmark('data.split_dataset_from_dir')
+def _split_dataset_from_dir(workdir, scale):
+    from mlutils.data.splitting import split_dataset_from_dir
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'])
+    target_path = os.path.join(workdir, 'split')
+    return (lambda: split_dataset_from_dir(dataset['images'], target_path, seed=0, label_path=dataset['labels']),
+            _remove(target_path))
+
+
+@benchmark('data.Augmentation.augment_images')
+def _augment_images(workdir, scale):
+    import albumentations as A
+    from mlutils.data.augmentation import Augmentation
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'])
+    target_path = os.path.join(workdir, 'augmented')
+    transform = A.Compose([A.RandomBrightnessContrast(p=1), A.HorizontalFlip()],
+                          bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
+    config = {'transform': transform, 'multiplier': 2, 'source_path': dataset['images'],
+              'label_path': dataset['labels'], 'target_path': target_path, 'seed': 0}
+    return lambda: Augmentation(config).augment_images(), _remove(target_path)
+
+
+@benchmark('data.Augmentation.augment_images.pre_transform')
+def _augment_images_pre_transform(workdir, scale):
+    import albumentations as A
+    from mlutils.data.augmentation import Augmentation
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'], image_size=(640, 480))
+    target_path = os.path.join(workdir, 'augmented')
+    bbox_params = A.BboxParams(format='yolo', label_fields=['class_labels'])
+    # the deterministic resize runs once per image instead of once per variant, images stay in OpenCV order
+    config = {'pre_transform': A.Compose([A.Resize(960, 1280)], bbox_params=bbox_params),
+              'transform': A.Compose([A.RandomBrightnessContrast(p=1), A.HorizontalFlip()], bbox_params=bbox_params),
+              'multiplier': 4, 'source_path': dataset['images'], 'label_path': dataset['labels'],
+              'target_path': target_path, 'seed': 0, 'color_order': 'bgr'}
+    return lambda: Augmentation(config).augment_images(), _remove(target_path)
+
+
+@benchmark('data.Augmentation.augment_images.full_transform')
+def _augment_images_full_transform(workdir, scale):
+    import albumentations as A
+    from mlutils.data.augmentation import Augmentation
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'], image_size=(640, 480))
+    target_path = os.path.join(workdir, 'augmented')
+    transform = A.Compose([A.Resize(960, 1280), A.RandomBrightnessContrast(p=1), A.HorizontalFlip()],
+                          bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
+    config = {'transform': transform, 'multiplier': 4, 'source_path': dataset['images'],
+              'label_path': dataset['labels'], 'target_path': target_path, 'seed': 0}
+    return lambda: Augmentation(config).augment_images(), _remove(target_path)
+
+
+@benchmark('data.Augmentation.augment_images.writer_threads')
+def _augment_images_writer_threads(workdir, scale):
+    import albumentations as A
+    from mlutils.data.augmentation import Augmentation
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'], image_size=(640, 480))
+    target_path = os.path.join(workdir, 'augmented')
+    transform = A.Compose([A.RandomBrightnessContrast(p=1), A.HorizontalFlip()],
+                          bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
+    # encoding and writing overlap the transforms of the next variants
+    config = {'transform': transform, 'multiplier': 4, 'source_path': dataset['images'],
+              'label_path': dataset['labels'], 'target_path': target_path, 'seed': 0, 'writer_threads': 2}
+    return lambda: Augmentation(config).augment_images(), _remove(target_path)
+
+
+@benchmark('yolov5.split_dataset_by_labels')
+def _split_dataset_by_labels(workdir, scale):
+    from mlutils.image.yolov5 import split_dataset_by_labels
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['images'])
+    target_path = os.path.join(workdir, 'by_labels')
+    return (lambda: split_dataset_by_labels(dataset['images'], dataset['labels'], dataset['names'], target_path,
+                                            save=True), _remove(target_path))
+
+
+@benchmark('yolov5.dataset_summary')
+def _dataset_summary(workdir, scale):
+    from mlutils.image.yolov5 import dataset_summary
+    dataset = synthetic.make_yolo_dataset(os.path.join(workdir, 'dataset'), scale['labels'], image_size=(16, 16))
+    return lambda: dataset_summary(dataset['data_file'], instances=True)
+
+
+@benchmark('file.copy_file')
+def _copy_file(workdir, scale):
+    from mlutils.file.utils import copy_file
+    source_path, target_path = os.path.join(workdir, 'images'), os.path.join(workdir, 'copied')
+    synthetic.make_image_folder(source_path, scale['images'])
+    return lambda: copy_file(source_path, target_path), _remove(target_path)
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, scale='small', repeat=5):
+    """
+    Parameters:
+        names <list>: Substrings selecting the benchmarks to be run, every benchmark by default.
+        scale <str>: 'small' or 'large', the size of the synthetic data.
+        repeat <int>: The number of measured runs of every benchmark.
+    Returns:
+        <dict>: meta data of the run and the results of measure by benchmark name.
+    """
+    selected = [name for name in BENCHMARKS if not names or any(x in name for x in names)]
+    results = {}
+    for name in selected:
+        workdir = tempfile.mkdtemp(prefix='mlutils_benchmark_')
+        try:
+            prepared = BENCHMARKS[name](workdir, SCALES[scale])
+            func, reset = prepared if isinstance(prepared, tuple) else (prepared, None)
+            results[name] = measure(func, reset, repeat)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print(f"{name:<48} {results[name]['min_seconds'] * 1000:10.2f} ms "
+              f"{results[name]['peak_memory_bytes'] / 1024 ** 2:10.2f} MiB", file=sys.stderr)
+    meta = {'commit': _commit(), 'scale': scale, 'repeat': repeat, 'python': platform.python_version(),
+            'numpy': np.__version__, 'opencv': cv2.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    return {'meta': meta, 'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='path of the JSON results, printed to stdout by default')
+    parser.add_argument('--filter', nargs='*', help='substrings of the benchmark names to be run')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--list', action='store_true', help='lists the benchmarks')
+    args = parser.parse_args()
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        sys.exit()
+    report = run(args.filter, args.scale, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
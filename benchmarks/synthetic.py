@@ -0,0 +1,98 @@
+"""
+Synthetic data generators used by the benchmarks, every generator is deterministic for a given seed.
+"""
+import os
+
+import cv2
+import fitz
+import numpy as np
+import yaml
+
+from mlutils.data.labels import write_label
+
+WORDS = ['invoice', 'total', 'amount', 'date', 'name', 'address', 'policy', 'number', 'premium', 'signature',
+         'insured', 'vehicle', 'driver', 'claim', 'payment', 'balance', 'due', 'account', 'tax', 'page']
+
+
+def make_pdf(path, pages=10, lines=40, seed=0):
+    """
+    Writes a PDF document of pages pages, each with lines lines of random words.
+    Returns:
+        <str>: The path of the document.
+    """
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        for line in range(lines):
+            text = ' '.join(rng.choice(WORDS, 6)) + f' {page_no}-{line}'
+            page.insert_text((40, 40 + line * 18), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_image(width=640, height=480, seed=0):
+    """
+    Returns:
+        <class 'numpy.ndarray'>: A BGR image of random rectangles on a noisy background.
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(100, 156, (height, width, 3), dtype=np.uint8)
+    for _ in range(8):
+        x0, x1 = np.sort(rng.integers(0, width, 2))
+        y0, y1 = np.sort(rng.integers(0, height, 2))
+        cv2.rectangle(image, (int(x0), int(y0)), (int(x1), int(y1)), rng.integers(0, 255, 3).tolist(), -1)
+    return image
+
+
+def make_image_folder(path, images=100, sizes=((640, 480), (200, 150)), extension='.jpg', seed=0):
+    """
+    Writes images images to path, cycling through sizes.
+    Returns:
+        <list>: The file names of the images.
+    """
+    os.makedirs(path, exist_ok=True)
+    files = []
+    for i in range(images):
+        width, height = sizes[i % len(sizes)]
+        file = f'image_{i:06d}{extension}'
+        cv2.imwrite(os.path.join(path, file), make_image(width, height, seed + i))
+        files.append(file)
+    return files
+
+
+def make_boxes(count=1000, size=1000, seed=0):
+    """
+    Returns:
+        <class 'numpy.ndarray'>: (count, 4) array of random (x0, y0, x1, y1) boxes inside a size x size image.
+    """
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, size * 0.9, (count, 2))
+    wh = rng.uniform(size * 0.01, size * 0.1, (count, 2))
+    return np.concatenate([xy, np.minimum(xy + wh, size)], axis=1)
+
+
+def make_yolo_dataset(path, images=100, objects=5, classes=10, image_size=(320, 240), seed=0):
+    """
+    Writes a YOLO dataset to path with images/ and labels/ folders, a classes.txt and a data.yaml of which every
+    split points to the same images.
+    Returns:
+        <dict>: images, labels and data_file paths and the class names.
+    """
+    rng = np.random.default_rng(seed)
+    image_path, label_path = os.path.join(path, 'images'), os.path.join(path, 'labels')
+    make_image_folder(image_path, images, sizes=(image_size,), seed=seed)
+    os.makedirs(label_path, exist_ok=True)
+    names = [f'class_{i}' for i in range(classes)]
+    for i in range(images):
+        centers = rng.uniform(0.2, 0.8, (objects, 2))
+        sizes = rng.uniform(0.05, 0.3, (objects, 2))
+        write_label(os.path.join(label_path, f'image_{i:06d}.txt'), rng.integers(0, classes, objects),
+                    np.concatenate([centers, sizes], axis=1))
+    with open(os.path.join(label_path, 'classes.txt'), 'w') as f:
+        f.write('\n'.join(names))
+    data_file = os.path.join(path, 'data.yaml')
+    with open(data_file, 'w') as f:
+        yaml.safe_dump({'train': './images', 'val': './images', 'test': './images', 'nc': classes, 'names': names}, f)
+    return {'images': image_path, 'labels': label_path, 'data_file': data_file, 'names': names}
@@ -1,3 +1,24 @@
-from mlutils.data.splitting import split_data, split_dataset_from_dir
-from mlutils.data.filter import filter_images_by_dimension
-__all__ = ['split_data', 'split_dataset_from_dir', 'filter_images_by_dimension']
\ No newline at end of file
+import importlib
+
+__all__ = ['split_data', 'split_dataset_from_dir', 'split_dataset_by_hash', 'filter_images_by_dimension',
+           'find_duplicates', 'deduplicate_dir']
+
+# submodules and their dependencies are only imported on first access (PEP 562)
+_exports = {'split_data': 'splitting', 'split_dataset_from_dir': 'splitting', 'split_dataset_by_hash': 'splitting',
+            'filter_images_by_dimension': 'filter', 'find_duplicates': 'dedup', 'deduplicate_dir': 'dedup'}
+_submodules = {'augmentation', 'dataset', 'dedup', 'filter', 'labels', 'shards', 'splitting'}
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(f'{__name__}.{_exports[name]}'), name)
+    elif name in _submodules:
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports) | _submodules)
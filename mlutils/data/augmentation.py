@@ -1,16 +1,56 @@
 import os
-from glob import glob
+import queue
+import random
+import threading
+import time
 import uuid
+import zlib
+from glob import glob
+from multiprocessing import Pool
 
-import albumentations as A
-import cv2
-from tqdm import tqdm
+import numpy as np
 
+from mlutils import instrumentation
+from mlutils.data.labels import read_label, write_label
+from mlutils.data.shards import ShardWriter
 from mlutils.exceptions import InvalidConfiguration
+from mlutils.image.writer import IMAGE_FORMATS, ImageWriter, encode_image
+from mlutils.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+tqdm = lazy_import('tqdm')
+
+_worker_augmentation = None
+
+
+def _init_worker(augmentation, instrumented):
+    global _worker_augmentation
+    _worker_augmentation = augmentation
+    augmentation._open_writer()
+    # forked workers inherit the records of the parent, they only report their own
+    instrumentation.reset()
+    if instrumented:
+        instrumentation.enable()
+    # forked workers inherit the parent's random state, reseed them so they don't produce identical samples
+    if augmentation.seed is None:
+        augmentation._seed(int.from_bytes(os.urandom(4), 'little'))
+
+
+def _augment_sample(task):
+    key, records = _worker_augmentation._augment_sample(task)
+    return key, records, instrumentation._collect() if instrumentation.is_enabled() else None
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
 
 
 class Augmentation:
-    __required_keys = ['transform', 'multiplier', 'source_path', 'target_path']
+    __required_keys = ['transform', 'multiplier', 'source_path']
+    __manifest_name = '.augmentation_manifest'
+    __target_formats = ('files', 'shards')
+    __color_orders = ('rgb', 'bgr')
 
     def __init__(self, config):
 
@@ -22,24 +62,57 @@ class Augmentation:
                 raise InvalidConfiguration(f'Missing required key "{key}"')
 
         self.transform = config['transform']
+        # deterministic stages (e.g. resizing) applied once per source image instead of once per variant
+        self.pre_transform = config.get('pre_transform')
         self.multiplier = config['multiplier']
         self.source_path = config['source_path']
-        self.target_path = config['target_path']
-        self.target_path_images = os.path.join(self.target_path, 'images')
-        os.makedirs(self.target_path_images, exist_ok=True)
-        try:
-            self.label_path = config['label_path']
-            self.target_path_labels = os.path.join(self.target_path, 'labels')
-            os.makedirs(self.target_path_labels, exist_ok=True)
-        except KeyError:
-            self.label_path = None
+        self.target_path = config.get('target_path')
+        self.workers = config.get('workers', 1)
+        self.chunk_size = config.get('chunk_size', 8)
+        self.seed = config.get('seed')
+        self.resume = config.get('resume', False)
+        for key in ['workers', 'chunk_size']:
+            if not isinstance(getattr(self, key), int) or getattr(self, key) < 1:
+                raise InvalidConfiguration(f'"{key}" must be a positive integer')
+        self.label_path = config.get('label_path')
+        self.target_format = config.get('target_format', 'files')
+        self.shard_size = config.get('shard_size', 256 * 1024 ** 2)
+        if self.target_format not in self.__target_formats:
+            raise InvalidConfiguration(f'"target_format" must be one of {self.__target_formats}')
+        # the colour order of the images given to the transforms, 'bgr' skips the conversions around OpenCV I/O
+        self.color_order = config.get('color_order', 'rgb')
+        if self.color_order not in self.__color_orders:
+            raise InvalidConfiguration(f'"color_order" must be one of {self.__color_orders}')
+        # the encoding of the saved images and the number of background threads encoding and writing them
+        self.image_format = config.get('image_format', 'jpg')
+        self.image_quality = config.get('image_quality')
+        self.image_compression = config.get('image_compression')
+        self.writer_threads = config.get('writer_threads', 0)
+        if self.image_format not in IMAGE_FORMATS:
+            raise InvalidConfiguration(f'"image_format" must be one of {IMAGE_FORMATS}')
+        if not isinstance(self.writer_threads, int) or self.writer_threads < 0:
+            raise InvalidConfiguration('"writer_threads" must be a non-negative integer')
+        self.__buffer = None
+        self.__writer = None
+        # target_path is only needed to save augmented images, streaming works without it
+        if self.target_path:
+            if self.target_format == 'shards':
+                self.target_path_shards = os.path.join(self.target_path, 'shards')
+            else:
+                self.target_path_images = os.path.join(self.target_path, 'images')
+                os.makedirs(self.target_path_images, exist_ok=True)
+                if self.label_path:
+                    self.target_path_labels = os.path.join(self.target_path, 'labels')
+                    os.makedirs(self.target_path_labels, exist_ok=True)
+            os.makedirs(self.target_path, exist_ok=True)
+            self.manifest_path = os.path.join(self.target_path, self.__manifest_name)
 
     def __load_images(self):
         images = [x for x in glob(os.path.join(self.source_path, "**/*"), recursive=True) if not os.path.isdir(x)]
         return images
 
     def __load_labels(self):
-        return [x for x in glob(os.path.join(self.source_path, "**/*"), recursive=True) if not os.path.isdir(x)] if self.label_path else []
+        return [x for x in glob(os.path.join(self.label_path, "**/*"), recursive=True) if not os.path.isdir(x)] if self.label_path else []
 
     def __map_dataset(self, images, labels):
         dataset = {}
@@ -53,81 +126,282 @@ class Augmentation:
                 dataset[os.path.splitext(file_name)[0]] |= {'label': file_path}
         return dataset
 
+    def __load_dataset(self):
+        return self.__map_dataset(self.__load_images(), self.__load_labels())
+
+    def __load_manifest(self):
+        if not self.resume or not os.path.exists(self.manifest_path):
+            return set()
+        with open(self.manifest_path) as f:
+            return set(line.rstrip('\n') for line in f if line.strip())
+
     def __read_image(self, path):
-        image = cv2.imread(path)
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        with instrumentation.stage('augmentation.read_image'):
+            image = cv2.imread(path)
+            if self.color_order == 'rgb':
+                # the decoded image is not shared, it is converted in place
+                cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+        if instrumentation.is_enabled():
+            instrumentation.count('augmentation.bytes_read', os.path.getsize(path))
         return image
 
     def __read_label(self, path):
-        with open(path) as f:
-            lines = f.readlines()
-            bboxes = []
-            _label_classes = []
-            for line in lines:
-                data = line.split()
-                label = int(data[0])
-                _label_classes.append(label)
-                obj_list = []
-                for d in data[1:]:
-                    d = float(d)
-                    obj_list.append(d)
-                bboxes.append(obj_list)
-        return bboxes, _label_classes
+        bboxes, _label_classes = read_label(path)
+        return bboxes.tolist(), _label_classes.tolist()
 
     def __save_label(self, file_name, transformed):
-        with open(os.path.join(self.target_path_labels, file_name + '.txt'), "w") as write_file:
-            for i in enumerate(transformed['class_labels']):
-                label = i[1]
-                write_file.write(str(label) + " ")
-                for j in transformed['bboxes'][i[0]]:
-                    string = "{:.6f}".format(j)
-                    write_file.write(string + " ")
-                write_file.write("\n")
+        write_label(os.path.join(self.target_path_labels, file_name + '.txt'), transformed['class_labels'],
+                    transformed['bboxes'])
+
+    def __to_bgr(self, image):
+        if self.color_order == 'bgr':
+            return image
+        # transformed images may share memory with the source image, they are converted to a reused buffer
+        if self.__buffer is None or self.__buffer.shape != image.shape or self.__buffer.dtype != image.dtype:
+            self.__buffer = np.empty_like(image)
+        return cv2.cvtColor(image, cv2.COLOR_RGB2BGR, dst=self.__buffer)
+
+    def _open_writer(self):
+        self.__writer = ImageWriter(self.image_format, self.image_quality, self.image_compression,
+                                    self.writer_threads)
+
+    def _close_writer(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
 
     def __save_image(self, file_name, transformed):
-        transformed_image = transformed["image"]
-        transformed_image = cv2.cvtColor(transformed_image, cv2.COLOR_BGR2RGB)
-        cv2.imwrite(os.path.join(self.target_path_images, file_name + '.jpg'), transformed_image)
+        path = os.path.join(self.target_path_images, file_name)
+        image = transformed["image"]
+        if not self.writer_threads:
+            with instrumentation.stage('augmentation.write_image'):
+                self.__writer.write(path, self.__to_bgr(image))
+            return None
+        # queued images outlive this call, they are converted to a new array instead of the reused buffer
+        image = image if self.color_order == 'bgr' else cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        with instrumentation.stage('augmentation.queue_image'):
+            return self.__writer.submit(path, image)
 
-    def augment_images(self):
-        images = self.__load_images()
-        labels = self.__load_labels()
-        dataset = self.__map_dataset(images, labels)
-        for k, v in tqdm(dataset.items(), desc="Augmenting images"):
-            image = self.__read_image(v['image'])
-            bboxes = _label_classes = None
+    def __encode_record(self, file_name, transformed):
+        with instrumentation.stage('augmentation.write_image'):
+            data = encode_image(self.__to_bgr(transformed["image"]), self.image_format, self.image_quality,
+                                self.image_compression)
+        instrumentation.count('augmentation.bytes_written', len(data))
+        labels = None
+        if self.label_path:
+            labels = np.column_stack([np.asarray(transformed['class_labels'], dtype=np.float64),
+                                      np.asarray(transformed['bboxes'], dtype=np.float64).reshape(-1, 4)])
+        return f'{file_name}.{self.image_format}', data, labels
+
+    def _seed(self, seed):
+        random.seed(seed)
+        np.random.seed(seed)
+        if hasattr(self.transform, 'set_random_seed'):
+            self.transform.set_random_seed(seed)
+
+    def __load_sample(self, key, sample):
+        if self.seed is not None:
+            self._seed((self.seed + zlib.crc32(key.encode())) & 0xffffffff)
+        image = self.__read_image(sample['image'])
+        bboxes = _label_classes = None
+        if self.label_path:
+            bboxes, _label_classes = self.__read_label(sample['label']) if 'label' in sample else ([], [])
+        if self.pre_transform is not None:
+            with instrumentation.stage('augmentation.pre_transform'):
+                if self.label_path:
+                    transformed = self.pre_transform(image=image, bboxes=bboxes, class_labels=_label_classes)
+                    bboxes, _label_classes = transformed['bboxes'], transformed['class_labels']
+                else:
+                    transformed = self.pre_transform(image=image)
+                image = transformed['image']
+        return image, bboxes, _label_classes
+
+    def __transform(self, image, bboxes, _label_classes):
+        instrumentation.count('augmentation.samples')
+        with instrumentation.stage('augmentation.transform'):
             if self.label_path:
-                bboxes, _label_classes = self.__read_label(v['label'])
-            self.__apply_transformation(_label_classes, bboxes, image)
+                return self.transform(image=image, bboxes=bboxes, class_labels=_label_classes)
+            return self.transform(image=image)
+
+    def _augment_sample(self, task):
+        key, sample = task
+        image, bboxes, _label_classes = self.__load_sample(key, sample)
+        # output names are derived from the source path so a resumed run overwrites partial outputs
+        new_name = uuid.uuid5(uuid.NAMESPACE_URL, os.path.abspath(sample['image'])).hex
+        records = self.__apply_transformation(new_name, _label_classes, bboxes, image)
+        instrumentation.count('augmentation.images')
+        return key, records
+
+    def augment_images(self):
+        """
+        Augments every image of source_path multiplier times and saves the results to target_path.
+        Images are processed by a pool of "workers" processes, dispatched in chunks of "chunk_size".
+        Completed images are recorded in a manifest under target_path, so when "resume" is set an interrupted
+        run skips the images which were already augmented.
+        Images are saved as "image_format" ('jpg', 'png', 'webp' or 'npy') through temporary files, so an interrupted
+        run leaves no truncated image. With "writer_threads", every worker encodes and writes its images in
+        background threads while it transforms the next variants, an image is recorded once all its variants are
+        written.
+        With "target_format" set to 'shards', the samples are packed into shards under target_path/shards
+        (see mlutils.data.shards) instead of being saved as individual image and label files.
+        Returns:
+            <dict>: number of augmented images, saved samples, elapsed seconds and throughput in images/s.
+        """
+        if not self.target_path:
+            raise InvalidConfiguration('"target_path" must have a valid value to save augmented images')
+        dataset = self.__load_dataset()
+        completed = self.__load_manifest()
+        tasks = [(k, v) for k, v in dataset.items() if k not in completed]
+        start = time.perf_counter()
+        writer = ShardWriter(self.target_path_shards, self.shard_size) if self.target_format == 'shards' else None
+        with open(self.manifest_path, 'a' if self.resume else 'w') as manifest:
+            try:
+                if self.workers == 1:
+                    self._open_writer()
+                    results = map(self._augment_sample, tasks)
+                    self.__record(results, manifest, len(tasks), writer)
+                else:
+                    with Pool(self.workers, initializer=_init_worker,
+                              initargs=(self, instrumentation.is_enabled())) as pool:
+                        results = pool.imap_unordered(_augment_sample, tasks, chunksize=self.chunk_size)
+                        self.__record(self.__merge_records(results), manifest, len(tasks), writer)
+            finally:
+                self._close_writer()
+                if writer:
+                    writer.close()
+        elapsed = time.perf_counter() - start
+        throughput = len(tasks) / elapsed if elapsed else 0.0
+        return {'images': len(tasks), 'samples': len(tasks) * self.multiplier, 'seconds': elapsed,
+                'images_per_second': throughput}
 
-    def __apply_transformation(self, _label_classes, bboxes, image):
-        new_name = uuid.uuid1().hex
+    def __merge_records(self, results):
+        # the instrumentation records of the workers are sent back with every image
+        for key, records, instrumentation_records in results:
+            if instrumentation_records:
+                instrumentation._merge(instrumentation_records)
+            yield key, records
+
+    def __record(self, results, manifest, total, writer=None):
+        for key, records in tqdm.tqdm(results, desc="Augmenting images", total=total):
+            if writer:
+                # shards are written by the parent process only, records reach the disk before the manifest
+                for record in records:
+                    writer.write(*record)
+                writer.flush()
+            manifest.write(key + '\n')
+            manifest.flush()
+
+    def __apply_transformation(self, new_name, _label_classes, bboxes, image):
+        records = []
+        pending = []
         for i in range(self.multiplier):
             i_new_name = new_name + f'_{i + 1}'
+            transformed = self.__transform(image, bboxes, _label_classes)
+            if self.target_format == 'shards':
+                records.append(self.__encode_record(i_new_name, transformed))
+                continue
+            pending.append(self.__save_image(i_new_name, transformed))
             if self.label_path:
-                transformed = transform(image=image, bboxes=bboxes, class_labels=_label_classes)
-                self.__save_image(i_new_name, transformed)
                 self.__save_label(i_new_name, transformed)
-            else:
-                transformed = transform(image=image)
-                self.__save_image(i_new_name, transformed)
-
-
-transform = A.Compose([
-    A.Blur(blur_limit=4, p=1),
-    A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=1),
-    A.Rotate(30)], bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
-
-# transform = A.Compose([
-#     A.Blur(blur_limit=4, p=1),
-#     A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=1),
-#     A.Rotate(30)])
-config = {
-    "transform": transform,
-    "source_path": "D:\\git\\mlutils\\tests\\data\\augmentation\\dataset\\",
-    "label_path": "D:\\git\\mlutils\\tests\\data\\augmentation\\labels\\",
-    "target_path": "D:\\git\\mlutils\\tests\\data\\augmentation\\tests\\",
-    "multiplier": 3
-}
-obj = Augmentation(config)
-obj.augment_images()
+        # the image is only recorded in the manifest once every variant is on disk, errors of the writers surface here
+        with instrumentation.stage('augmentation.wait_writers'):
+            for future in pending:
+                if future is not None:
+                    future.result()
+        return records
+
+    def iter_augmented(self, workers=0, prefetch=None):
+        """
+        Yields augmented samples on the fly instead of saving them to target_path.
+        Every source image is read once and transformed multiplier times.
+        Args:
+            workers: <int> number of background threads augmenting images ahead of the consumer,
+                     0 augments in the calling thread.
+            prefetch: <int> maximum number of augmented samples buffered by the workers,
+                      defaults to twice the samples of one image per worker.
+        Yields:
+            <tuple>: (image, bboxes, class_labels) of every augmented variant, bboxes and class_labels
+                     are None when label_path is not configured.
+        Note:
+            With background workers the order of the samples is not deterministic, even if "seed" is set.
+        """
+        tasks = list(self.__load_dataset().items())
+        if not workers:
+            for task in tasks:
+                yield from self.__iter_variants(task)
+        else:
+            yield from self.__iter_prefetched(tasks, workers, prefetch or 2 * self.multiplier * workers)
+
+    def __iter_variants(self, task):
+        image, bboxes, _label_classes = self.__load_sample(*task)
+        for _ in range(self.multiplier):
+            transformed = self.__transform(image, bboxes, _label_classes)
+            yield transformed['image'], transformed.get('bboxes'), transformed.get('class_labels')
+
+    def __iter_prefetched(self, tasks, workers, prefetch):
+        samples = queue.Queue(maxsize=prefetch)
+        pending = iter(tasks)
+        lock = threading.Lock()
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    samples.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def work():
+            try:
+                while not stop.is_set():
+                    with lock:
+                        task = next(pending, None)
+                    if task is None:
+                        break
+                    for sample in self.__iter_variants(task):
+                        if not put(sample):
+                            return
+            except Exception as e:
+                put(_Failure(e))
+            finally:
+                put(done)
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            finished = 0
+            while finished < workers:
+                item = samples.get()
+                if item is done:
+                    finished += 1
+                elif isinstance(item, _Failure):
+                    raise item.error
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+
+class AugmentedDataset:
+    """
+    Framework agnostic iterable dataset of augmented samples, it can be wrapped by a PyTorch IterableDataset
+    or passed to tf.data.Dataset.from_generator. Every iteration augments the source images again.
+    Args:
+        augmentation: <Augmentation> configured augmentation, target_path is not required.
+        workers: <int> number of background threads augmenting images ahead of the consumer.
+        prefetch: <int> maximum number of augmented samples buffered by the workers.
+    """
+
+    def __init__(self, augmentation, workers=0, prefetch=None):
+        self.augmentation = augmentation
+        self.workers = workers
+        self.prefetch = prefetch
+
+    def __iter__(self):
+        return self.augmentation.iter_augmented(workers=self.workers, prefetch=self.prefetch)
@@ -0,0 +1,254 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from mlutils import instrumentation
+from mlutils.exceptions import DirectoryNotFound
+from mlutils.file.utils import copy_file, make_dir
+from mlutils.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+__all__ = ['perceptual_hash', 'hash_image', 'compute_hashes', 'BKTree', 'find_duplicates', 'group_duplicates',
+           'deduplicate_dir']
+
+
+def _hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def perceptual_hash(image):
+    """
+    Computes the 64 bit DCT hash of an image, resizing, re-encoding or slightly changing the colors of an image only
+    flips a few bits of it.
+    Args:
+        image: <numpy.ndarray> grayscale or BGR image.
+    Returns:
+        <int>: the hash, similar images have hashes with a small Hamming distance.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    # the lowest 8x8 frequencies without the DC term are compared to their median
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_image(path):
+    """
+    Args:
+        path: path of the image.
+    Returns:
+        <tuple>: the sha256 hex digest of the file and its perceptual hash, None if it can't be decoded as image.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return hashlib.sha256(data).hexdigest(), perceptual_hash(image) if image is not None else None
+
+
+def _load_index(index_path):
+    if index_path and os.path.exists(index_path):
+        with open(index_path) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_index(index_path, index):
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+@instrumentation.timed('dedup.compute_hashes')
+def compute_hashes(image_paths, workers=8, index_path=None):
+    """
+    Hashes many images with a pool of threads.
+    Args:
+        image_paths: <list> paths of the images.
+        workers: <int> number of threads hashing images.
+        index_path: <string> path of a json file storing the hashes by image path, size and modification time,
+                    images which are unchanged since a previous call are not hashed again.
+    Returns:
+        <dict>: image path as key and (sha256, perceptual hash or None) as value.
+    """
+    index = _load_index(index_path)
+    stats = {path: os.stat(path) for path in image_paths}
+    hashes = {}
+    missing = []
+    for path in image_paths:
+        entry = index.get(path)
+        if entry and entry['mtime'] == stats[path].st_mtime_ns and entry['size'] == stats[path].st_size:
+            hashes[path] = (entry['sha256'], int(entry['phash'], 16) if entry['phash'] else None)
+        else:
+            missing.append(path)
+    instrumentation.count('dedup.index_hits', len(image_paths) - len(missing))
+    instrumentation.count('dedup.images_hashed', len(missing))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, (sha256, phash) in zip(missing, executor.map(hash_image, missing)):
+            hashes[path] = (sha256, phash)
+            index[path] = {'mtime': stats[path].st_mtime_ns, 'size': stats[path].st_size, 'sha256': sha256,
+                           'phash': f'{phash:016x}' if phash is not None else None}
+    if index_path and missing:
+        _save_index(index_path, index)
+    return hashes
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree of integer hashes under the Hamming distance. A search only descends into the children whose
+    distance to their parent is within radius of the distance between the query and the parent, which skips most of
+    the tree for small radii.
+    """
+
+    def __init__(self, items=None):
+        """
+        Args:
+            items: <iterable> (hash, item) pairs to add.
+        """
+        self.__root = None
+        self.__length = 0
+        for value, item in items or ():
+            self.add(value, item)
+
+    def __len__(self):
+        return self.__length
+
+    def add(self, value, item):
+        self.__length += 1
+        # a node is [hash, items with that hash, children by distance]
+        if self.__root is None:
+            self.__root = [value, [item], {}]
+            return
+        node = self.__root
+        while True:
+            distance = _hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, radius):
+        """
+        Args:
+            value: <int> the queried hash.
+            radius: <int> the maximum Hamming distance.
+        Returns:
+            <list>: (distance, item) of every item within radius of value.
+        """
+        found = []
+        nodes = [self.__root] if self.__root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = _hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            nodes.extend(child for d, child in node[2].items() if distance - radius <= d <= distance + radius)
+        return found
+
+
+def _find(parents, x):
+    while parents[x] != x:
+        parents[x] = parents[parents[x]]
+        x = parents[x]
+    return x
+
+
+def _union(parents, a, b):
+    a, b = _find(parents, a), _find(parents, b)
+    if a != b:
+        parents[max(a, b)] = min(a, b)
+
+
+def find_duplicates(image_paths, radius=4, workers=8, index_path=None):
+    """
+    Finds the exact duplicates (same sha256) and near duplicates (perceptual hashes within radius) of many images.
+    Args:
+        image_paths: <list> paths of the images.
+        radius: <int> maximum Hamming distance of the perceptual hashes of near duplicates, None only finds exact
+                duplicates.
+        workers: <int> number of threads hashing images.
+        index_path: <string> path of a json file storing the hashes between calls, see compute_hashes.
+    Returns:
+        <list>: the clusters of duplicates, sorted lists of at least two image paths.
+    """
+    image_paths = sorted(image_paths)
+    hashes = compute_hashes(image_paths, workers=workers, index_path=index_path)
+    parents = list(range(len(image_paths)))
+    first = {}
+    for i, path in enumerate(image_paths):
+        _union(parents, first.setdefault(hashes[path][0], i), i)
+    if radius is not None:
+        by_hash = {}
+        for i, path in enumerate(image_paths):
+            if hashes[path][1] is not None:
+                by_hash.setdefault(hashes[path][1], []).append(i)
+        tree = BKTree((value, indices[0]) for value, indices in by_hash.items())
+        for value, indices in by_hash.items():
+            for i in indices[1:]:
+                _union(parents, indices[0], i)
+            for _, i in tree.search(value, radius):
+                _union(parents, indices[0], i)
+    clusters = {}
+    for i, path in enumerate(image_paths):
+        clusters.setdefault(_find(parents, i), []).append(path)
+    clusters = [cluster for cluster in clusters.values() if len(cluster) > 1]
+    instrumentation.count('dedup.duplicates', sum(len(cluster) - 1 for cluster in clusters))
+    return clusters
+
+
+def group_duplicates(items, clusters, groups=None):
+    """
+    Args:
+        items: <list> the items, e.g. image paths.
+        clusters: <list> clusters of duplicate items, see find_duplicates.
+        groups: <list> an existing group of every item, which are merged with the clusters.
+    Returns:
+        <list>: group of every item, an index shared by all items of a cluster and of a group.
+    """
+    position = {item: i for i, item in enumerate(items)}
+    parents = list(range(len(items)))
+    for cluster in clusters:
+        members = [position[item] for item in cluster if item in position]
+        for i in members[1:]:
+            _union(parents, members[0], i)
+    if groups is not None:
+        first = {}
+        for i, group in enumerate(groups):
+            _union(parents, first.setdefault(group, i), i)
+    return [_find(parents, i) for i in range(len(items))]
+
+
+def deduplicate_dir(source_path, target_path, radius=4, copy_mode='copy', workers=8, index_path=None):
+    """
+    Saves the images of source directory to target directory without their duplicates, the first image (by name)
+    of every cluster of duplicates is kept.
+    Args:
+        source_path: path for source directory.
+        target_path: path of target directory.
+        radius: maximum Hamming distance of near duplicates, see find_duplicates.
+        copy_mode: 'copy', 'hardlink', 'symlink' or 'reflink', how the kept images are saved to target_path.
+        workers: number of threads hashing images.
+        index_path: path of a json file storing the hashes between calls, see compute_hashes.
+    Returns:
+        <list>: the clusters of duplicates found, as file names.
+    """
+    if not os.path.exists(source_path):
+        raise DirectoryNotFound(f'Unable to find source directory', source_path)
+    make_dir(target_path)
+    files = sorted(entry.name for entry in os.scandir(source_path) if entry.is_file())
+    clusters = find_duplicates([os.path.join(source_path, file) for file in files], radius=radius, workers=workers,
+                               index_path=index_path)
+    clusters = [[os.path.basename(path) for path in cluster] for cluster in clusters]
+    dropped = {file for cluster in clusters for file in cluster[1:]}
+    copy_file(source_path, target_path, [file for file in files if file not in dropped], mode=copy_mode)
+    return clusters
@@ -1,13 +1,62 @@
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-import cv2
-
+from mlutils import instrumentation
 from mlutils.exceptions import DirectoryNotFound
 from mlutils.file.utils import make_dir, copy_file
-from mlutils.image.utils import check_minimum_dimension
+from mlutils.image.utils import check_minimum_size, get_image_size
+
+
+def __load_size_cache(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)
+    return {}
+
+
+def __save_size_cache(cache_path, cache):
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+@instrumentation.timed('filter.get_image_sizes')
+def get_image_sizes(image_paths, workers=8, cache_path=None):
+    """
+    This is which reads the size of many images from their headers with a pool of threads.
+    Args:
+        image_paths: <list> paths of the images.
+        workers: <int> number of threads reading image headers.
+        cache_path: <string> path of a json file caching the sizes by image path and modification time,
+                    images which are unchanged since a previous call are not read again.
+    Returns:
+        <dict>: image path as key and (width, height) or None if the image can't be read as value.
+    """
+    cache = __load_size_cache(cache_path)
+    mtimes = {path: os.stat(path).st_mtime_ns for path in image_paths}
+    sizes = {}
+    missing = []
+    for path in image_paths:
+        entry = cache.get(path)
+        if entry and entry[0] == mtimes[path]:
+            sizes[path] = tuple(entry[1]) if entry[1] else None
+        else:
+            missing.append(path)
+    instrumentation.count('filter.size_cache_hits', len(image_paths) - len(missing))
+    instrumentation.count('filter.images_probed', len(missing))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, size in zip(missing, executor.map(get_image_size, missing)):
+            sizes[path] = size
+            cache[path] = [mtimes[path], size]
+    if cache_path and missing:
+        __save_size_cache(cache_path, cache)
+    return sizes
 
 
-def filter_images_by_dimension(source_path, target_path, min_width=320, min_height=320):
+def filter_images_by_dimension(source_path, target_path, min_width=320, min_height=320, copy_mode='copy', workers=8,
+                               cache_path=None):
     """
     This is which filter image dataset by its dimension and remove images which are smaller than the minimum width and height.
     If no minimum width or height is provided, the resolution of 320x320 will be considered as minimum resolution.
@@ -16,16 +65,21 @@ def filter_images_by_dimension(source_path, target_path, min_width=320, min_heig
         target_path: path of target directory
         min_width: The minimum width for valid image.
         min_height: the minimum height for valid image.
+        copy_mode: 'copy', 'hardlink', 'symlink' or 'reflink', how valid images are saved to target_path.
+        workers: number of threads reading image sizes.
+        cache_path: path of a json file caching image sizes between calls, see get_image_sizes.
     """
     make_dir(target_path)
     if os.path.exists(source_path):
-        valid_images = []
+        files = []
         for dir_path, _, filenames in os.walk(source_path):
             for file in filenames:
-                image_path = os.path.abspath(os.path.join(dir_path, file))
-                image = cv2.imread(image_path, 0)
-                if check_minimum_dimension(image, min_width, min_height):
-                    valid_images.append(file)
-        copy_file(source_path, target_path, valid_images)
+                files.append((file, os.path.abspath(os.path.join(dir_path, file))))
+        sizes = get_image_sizes([image_path for _, image_path in files], workers=workers, cache_path=cache_path)
+        valid_images = [file for file, image_path in files
+                        if check_minimum_size(sizes[image_path], min_width, min_height)]
+        instrumentation.count('filter.images', len(files))
+        instrumentation.count('filter.valid_images', len(valid_images))
+        copy_file(source_path, target_path, valid_images, mode=copy_mode)
     else:
-        raise DirectoryNotFound(f'Unable to find source directory')
\ No newline at end of file
+        raise DirectoryNotFound(f'Unable to find source directory', source_path)
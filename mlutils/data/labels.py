@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+
+from mlutils import instrumentation
+
+__all__ = ['parse_labels', 'read_label', 'read_label_dir', 'format_labels', 'write_label']
+
+_COLUMNS = 5
+
+
+def _split_rows(text):
+    return [line.split() for line in text.splitlines() if line.strip()]
+
+
+def _is_regular(rows):
+    return all(len(row) == _COLUMNS for row in rows)
+
+
+def _parse_rows(rows):
+    # rows with extra columns (e.g. segments) only keep the class and the bounding box
+    for row in rows:
+        if len(row) < _COLUMNS:
+            raise ValueError(f'Label row "{" ".join(row)}" has fewer than {_COLUMNS} values')
+    return np.array([row[:_COLUMNS] for row in rows], dtype=np.float64).reshape(-1, _COLUMNS)
+
+
+def parse_labels(text):
+    """
+    Parses the content of a YOLO label file in one shot.
+    Args:
+        text: <string> content of the label file.
+    Returns:
+        <numpy.ndarray>: (n, 5) float array of class id, x_center, y_center, width and height per object.
+    """
+    rows = _split_rows(text)
+    if not _is_regular(rows):
+        return _parse_rows(rows)
+    return np.array(rows, dtype=np.float64).reshape(-1, _COLUMNS)
+
+
+@instrumentation.timed('labels.read_label')
+def read_label(path):
+    """
+    Reads YOLO label file.
+    Args:
+        path: <string> path to the label file.
+    Returns:
+        <tuple>: (n, 4) float array of bounding boxes and (n,) int array of class ids.
+    """
+    with open(path) as f:
+        text = f.read()
+    instrumentation.count('labels.bytes_read', len(text))
+    labels = parse_labels(text)
+    return labels[:, 1:], labels[:, 0].astype(np.int64)
+
+
+def __cache_path(label_path):
+    label_path = os.path.normpath(label_path)
+    return label_path + '.cache.npz'
+
+
+def __load_cache(cache_path):
+    try:
+        with np.load(cache_path) as cache:
+            names, stats, offsets, values = cache['names'], cache['stats'], cache['offsets'], cache['values']
+    except (OSError, KeyError, ValueError):
+        return {}
+    return {str(name): (tuple(stat), values[offsets[i]:offsets[i + 1]]) for i, (name, stat) in
+            enumerate(zip(names, stats))}
+
+
+def __save_cache(cache_path, names, stats, labels):
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in labels], out=offsets[1:])
+    values = np.concatenate(labels) if labels else np.empty((0, _COLUMNS))
+    tmp_path = cache_path + '.tmp.npz'
+    np.savez(tmp_path, names=np.array(names, dtype=str), stats=np.array(stats, dtype=np.int64).reshape(-1, 2),
+             offsets=offsets, values=values)
+    os.replace(tmp_path, cache_path)
+
+
+@instrumentation.timed('labels.read_label_dir')
+def read_label_dir(label_path, cache=False, exclude=('classes.txt',)):
+    """
+    Reads every YOLO label file (*.txt) of a directory, the text of all files is parsed in one batch.
+    When cache is True, the parsed labels are persisted next to the directory (<label_path>.cache.npz) keyed by
+    file modification time and size, so later calls only parse the files which were added or modified.
+    Args:
+        label_path: <string> path to label directory.
+        cache: <boolean> reads and updates the binary label cache if True.
+        exclude: <tuple> file names which are not label files.
+    Returns:
+        <dict>: file name as key and (n, 5) float array of class id and bounding box per object as value.
+    """
+    entries = sorted((entry.name, entry.stat()) for entry in os.scandir(label_path)
+                     if entry.name.endswith('.txt') and entry.name not in exclude and entry.is_file())
+    names = [name for name, _ in entries]
+    stats = [(stat.st_mtime_ns, stat.st_size) for _, stat in entries]
+    cached = __load_cache(__cache_path(label_path)) if cache else {}
+
+    labels = {}
+    missing = []
+    for name, stat in zip(names, stats):
+        if name in cached and cached[name][0] == stat:
+            labels[name] = cached[name][1]
+        else:
+            missing.append(name)
+    instrumentation.count('labels.files', len(names))
+    if cache:
+        instrumentation.count('labels.cache_hits', len(names) - len(missing))
+        instrumentation.count('labels.cache_misses', len(missing))
+
+    texts = []
+    for name in missing:
+        with open(os.path.join(label_path, name)) as f:
+            texts.append(f.read())
+    instrumentation.count('labels.bytes_read', sum(len(text) for text in texts))
+    rows = [_split_rows(text) for text in texts]
+    regular = [_is_regular(file_rows) for file_rows in rows]
+    # the files with exactly 5 values per row are converted in one batch
+    values = np.array([row for file_rows, is_regular in zip(rows, regular) if is_regular for row in file_rows],
+                      dtype=np.float64).reshape(-1, _COLUMNS)
+    start = 0
+    for name, file_rows, is_regular in zip(missing, rows, regular):
+        if is_regular:
+            labels[name] = values[start:start + len(file_rows)]
+            start += len(file_rows)
+        else:
+            labels[name] = _parse_rows(file_rows)
+
+    if cache and (missing or len(cached) != len(names)):
+        __save_cache(__cache_path(label_path), names, stats, [labels[name] for name in names])
+    return {name: labels[name] for name in names}
+
+
+def format_labels(class_labels, bboxes):
+    """
+    Formats class ids and bounding boxes as content of a YOLO label file.
+    Args:
+        class_labels: <list> class id per object.
+        bboxes: <list> or <numpy.ndarray> bounding box per object.
+    Returns:
+        <string>: content of the label file.
+    """
+    if not len(class_labels):
+        return ''
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(len(class_labels), -1)
+    line = '%d ' + '%.6f ' * bboxes.shape[1] + '\n'
+    return ''.join(line % (label, *bbox) for label, bbox in zip(class_labels, bboxes.tolist()))
+
+
+@instrumentation.timed('labels.write_label')
+def write_label(path, class_labels, bboxes):
+    """
+    Writes YOLO label file with a single buffered write.
+    Args:
+        path: <string> path to the label file.
+        class_labels: <list> class id per object.
+        bboxes: <list> or <numpy.ndarray> bounding box per object.
+    """
+    text = format_labels(class_labels, bboxes)
+    with open(path, 'w') as f:
+        f.write(text)
+    instrumentation.count('labels.bytes_written', len(text))
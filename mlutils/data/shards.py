@@ -0,0 +1,247 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from mlutils import instrumentation
+from mlutils.exceptions import DirectoryNotFound
+from mlutils.image.writer import decode_image
+
+__all__ = ['ShardWriter', 'ShardReader']
+
+# every shard starts with the magic, followed by records of a header (key, data and label sizes), the utf-8 key,
+# the encoded image and the float64 label array
+_MAGIC = b'MLSHARD1'
+_HEADER = struct.Struct('<IQII')
+_INDEX_DTYPE = [('shard', np.uint32), ('offset', np.uint64)]
+
+
+def _shard_name(shard_no):
+    return f'shard-{shard_no:05d}.bin'
+
+
+def _shard_files(path):
+    return sorted(name for name in os.listdir(path) if name.startswith('shard-') and name.endswith('.bin'))
+
+
+def _scan_shard(file_path):
+    # (key, offset) of every complete record and the end of the last one, a record cut by a crash is ignored
+    records = []
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            return records, 0
+        offset = len(_MAGIC)
+        while offset + _HEADER.size <= size:
+            key_length, data_length, rows, columns = _HEADER.unpack(f.read(_HEADER.size))
+            end = offset + _HEADER.size + key_length + data_length + rows * columns * 8
+            if end > size:
+                break
+            records.append((f.read(key_length).decode(), offset))
+            f.seek(end)
+            offset = end
+    return records, offset
+
+
+def _read_index(path):
+    # the index is rebuilt from the shards when it is missing or doesn't match their sizes
+    shards = _shard_files(path)
+    sizes = [os.path.getsize(os.path.join(path, name)) for name in shards]
+    try:
+        with open(os.path.join(path, 'index.json')) as f:
+            meta = json.load(f)
+        if meta['shards'] == shards and meta['sizes'] == sizes:
+            return np.load(os.path.join(path, 'index.npy'), mmap_mode='r'), shards
+    except (OSError, ValueError, KeyError):
+        pass
+    entries = {}
+    for shard_no, name in enumerate(shards):
+        for key, offset in _scan_shard(os.path.join(path, name))[0]:
+            entries[key] = (shard_no, offset)
+    return _to_index(entries), shards
+
+
+def _to_index(entries):
+    keys = sorted(entries)
+    width = max([len(key.encode()) for key in keys] + [1])
+    index = np.empty(len(keys), dtype=[('key', f'S{width}')] + _INDEX_DTYPE)
+    index['key'] = [key.encode() for key in keys]
+    index['shard'] = [entries[key][0] for key in keys]
+    index['offset'] = [entries[key][1] for key in keys]
+    return index
+
+
+class ShardWriter:
+    """
+    Packs records of an encoded image and its label array into a few large shard files instead of many small files,
+    a new shard is started when the current one grows over max_shard_size bytes. On close, a sorted key index is
+    written next to the shards, which ShardReader memory maps for random access.
+    Opening an existing shard directory appends to it, records written again replace the previous record of the
+    same key, and records of a run interrupted before close are recovered from the shards.
+    """
+
+    def __init__(self, path, max_shard_size=256 * 1024 ** 2):
+        """
+        Parameters:
+            path <str>: The directory of the shards.
+            max_shard_size <int>: The size in bytes above which a new shard is started.
+        """
+        self.path = path
+        self.max_shard_size = max_shard_size
+        os.makedirs(path, exist_ok=True)
+        index, shards = _read_index(path)
+        self.__entries = {key.decode(): (int(shard), int(offset)) for key, shard, offset in index.tolist()}
+        self.__shard_no = len(shards)
+        self.__file = None
+        self.__offset = 0
+
+    def __open_shard(self):
+        self.__close_shard()
+        self.__file = open(os.path.join(self.path, _shard_name(self.__shard_no)), 'wb')
+        self.__file.write(_MAGIC)
+        self.__offset = len(_MAGIC)
+        self.__shard_no += 1
+
+    def __close_shard(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    def write(self, key, data, labels=None):
+        """
+        Parameters:
+            key <str>: The unique key of the record, e.g. the image file name.
+            data <bytes>: The encoded image.
+            labels <class 'numpy.ndarray'>: (n, 5) array of class id and bounding box per object.
+        """
+        if self.__file is None or self.__offset >= self.max_shard_size:
+            self.__open_shard()
+        key_bytes = key.encode()
+        # images without objects are stored as (0, 5) so readers can always index the columns
+        labels = np.asarray(labels if labels is not None else (), dtype='<f8').reshape(-1, 5)
+        header = _HEADER.pack(len(key_bytes), len(data), *labels.shape)
+        self.__file.write(header + key_bytes)
+        self.__file.write(data)
+        self.__file.write(labels.tobytes())
+        self.__entries[key] = (self.__shard_no - 1, self.__offset)
+        length = len(header) + len(key_bytes) + len(data) + labels.nbytes
+        self.__offset += length
+        instrumentation.count('shards.records')
+        instrumentation.count('shards.bytes_written', length)
+
+    def flush(self):
+        """ Flushes the current shard, its records are recovered even if the writer is not closed """
+        if self.__file is not None:
+            self.__file.flush()
+
+    def close(self):
+        """ Closes the current shard and writes the key index """
+        self.__close_shard()
+        shards = _shard_files(self.path)
+        np.save(os.path.join(self.path, 'index.tmp.npy'), _to_index(self.__entries))
+        os.replace(os.path.join(self.path, 'index.tmp.npy'), os.path.join(self.path, 'index.npy'))
+        meta = {'shards': shards, 'sizes': [os.path.getsize(os.path.join(self.path, name)) for name in shards]}
+        with open(os.path.join(self.path, 'index.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(self.path, 'index.json.tmp'), os.path.join(self.path, 'index.json'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ShardReader:
+    """
+    Reads the records written by ShardWriter. The shards and the key index are memory mapped, records are returned
+    as (data, labels) views of the shards without copy.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters:
+            path <str>: The directory of the shards.
+        """
+        if not os.path.isdir(path):
+            raise DirectoryNotFound('Unable to find shard directory', path)
+        self.path = path
+        self.__index, shards = _read_index(path)
+        self.__shards = []
+        for name in shards:
+            with open(os.path.join(path, name), 'rb') as f:
+                # a shard created by an interrupted writer may be empty, no record points to it
+                self.__shards.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(
+                    os.path.join(path, name)) else b'')
+
+    def __len__(self):
+        return len(self.__index)
+
+    def __contains__(self, key):
+        return self.__find(key) is not None
+
+    def __find(self, key):
+        key_bytes = key.encode()
+        i = np.searchsorted(self.__index['key'], key_bytes)
+        if i < len(self.__index) and self.__index['key'][i] == key_bytes:
+            return i
+        return None
+
+    def __read(self, shard, offset):
+        buffer = self.__shards[shard]
+        key_length, data_length, rows, columns = _HEADER.unpack_from(buffer, offset)
+        start = offset + _HEADER.size + key_length
+        data = np.frombuffer(buffer, dtype=np.uint8, count=data_length, offset=start)
+        labels = np.frombuffer(buffer, dtype='<f8', count=rows * columns, offset=start + data_length)
+        instrumentation.count('shards.bytes_read', _HEADER.size + key_length + data_length + labels.nbytes)
+        return data, labels.reshape(rows, columns)
+
+    def keys(self):
+        """
+        Returns:
+            <list>: The keys of the records, sorted.
+        """
+        return [key.decode() for key in self.__index['key'].tolist()]
+
+    def __getitem__(self, key):
+        """
+        Returns:
+            <tuple>: The encoded image as uint8 array and the (n, 5) label array of the record.
+        """
+        i = self.__find(key)
+        if i is None:
+            raise KeyError(key)
+        return self.__read(int(self.__index['shard'][i]), int(self.__index['offset'][i]))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def read_image(self, key, flags=1):
+        """
+        Returns:
+            <class 'numpy.ndarray'>: The decoded BGR image of the record, see cv2.imdecode for flags.
+        """
+        return decode_image(self[key][0], flags)
+
+    def __iter__(self):
+        """
+        Streams the records in the order they are stored, shard by shard.
+        Yields:
+            <tuple>: (key, data, labels) of every record.
+        """
+        order = np.lexsort((self.__index['offset'], self.__index['shard']))
+        for i in order:
+            entry = self.__index[i]
+            yield (entry['key'].decode(),) + self.__read(int(entry['shard']), int(entry['offset']))
+
+    def close(self):
+        # views returned by the reader keep the memory maps alive until they are released
+        self.__shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
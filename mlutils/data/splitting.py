@@ -1,55 +1,141 @@
+import hashlib
+import json
 import math
 import os
-import random as rand
 import numpy as np
-from tqdm import tqdm
-from mlutils.exceptions import InvalidSplittingValues, InsufficientData, DirectoryNotFound
+from mlutils.exceptions import InvalidSplittingValues, InsufficientData, DirectoryNotFound, InvalidConfiguration
 from mlutils.data.dataset import Dataset
+from mlutils.data.dedup import find_duplicates, group_duplicates
+from mlutils.data.labels import read_label_dir
+from mlutils.data.shards import ShardWriter
 from mlutils.file.utils import copy_file, get_files_from_dir, make_dir
 
-__all__ = ['split_data']
+__all__ = ['split_data', 'split_indices', 'get_yolo_strata', 'split_dataset_by_hash']
 
 
-def split_data(data, train=.70, valid=.20, unseen_test=0.0, random=True):
+def __stratified_order(order, labels, rng):
+    # spreads the members of every class evenly over the order, so any prefix of it is stratified
+    _, inverse, counts = np.unique(labels[order], return_inverse=True, return_counts=True)
+    by_class = np.argsort(inverse, kind='stable')
+    rank = np.empty(len(order), dtype=np.float64)
+    rank[by_class] = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+    offset = rng.random(len(order)) if rng is not None else 0.5
+    return order[np.argsort((rank + offset) / counts[inverse], kind='stable')]
+
+
+def split_indices(length, train=.70, valid=.20, unseen_test=0.0, random=True, seed=None, stratify=None, groups=None):
     """
-    This method splits the given data into training, validation and unseen testing datasets based on
-    the splitting ratio provided as an input for each dataset.
+    This method splits the indices of a dataset into training, validation and unseen testing indices based on
+    the splitting ratio provided as an input for each dataset, without touching the data itself.
        Args:
-           data: List or numpy array
+           length: number of items in the dataset
            train: number of percent data that needs to be considered for training
            valid: number of percent data that needs to be considered for valid
            unseen_test: number of percent data that needs to be considered for unseen_test
            random: if True it will randomly shuffle data
+           seed: seed or numpy Generator used to shuffle data, the split is reproducible for a given seed
+           stratify: class label of every item, every class is split with the same ratios
+           groups: group of every item, items of a group always end up in the same dataset,
+                   the split ratios are then approximated at group boundaries
 
            train, valid, unseen_test values must be greater than 0 and less than 1.
            sum of teh train, valid, unseen_test values must be greater 1.
        Return:
-           Dataset object with the train, valid, unseen_test dataset based on the splitting ratio.
+           <dict> train, valid and unseen_test (if unseen_test is not 0) index arrays.
        """
-    if random is True: rand.shuffle(data)
     if train >= 1 or valid >= 1 or unseen_test >= 1 or not math.isclose(sum([train, valid, unseen_test]), 1):
         raise InvalidSplittingValues({'train': train, 'valid': valid, 'unseen_test': unseen_test})
-    if unseen_test != 0:
-        unseen_ratio = int(unseen_test * len(data))
-        valid_ratio = int((valid + unseen_test) * len(data))
-        if unseen_ratio == 0 or valid_ratio == 0:
-            raise InsufficientData(f'Unable to Split data with length of {len(data)}')
-        unseen_test, valid, train = np.split(data, [unseen_ratio,
-                                                    valid_ratio])
-        return Dataset({'train': train,
-                        'valid': valid,
-                        'unseen_test': unseen_test})
+    unseen_ratio = int(unseen_test * length)
+    valid_ratio = int((valid + unseen_test) * length)
+    if (unseen_test != 0 and unseen_ratio == 0) or valid_ratio == 0:
+        raise InsufficientData(f'Unable to Split data with length of {length}')
+
+    rng = np.random.default_rng(seed) if random else None
+    if groups is not None:
+        _, first, group_of, sizes = np.unique(np.asarray(groups), return_index=True, return_inverse=True,
+                                              return_counts=True)
+        units = np.arange(len(sizes))
     else:
-        valid_ratio = int(valid * len(data))
-        if valid_ratio == 0:
-            raise InsufficientData(f'Unable to Split data with length of {len(data)}')
-        valid, train = np.split(data, [valid_ratio])
+        units = np.arange(length)
+    order = rng.permutation(units) if rng is not None else units
+    if stratify is not None:
+        labels = np.asarray(stratify)
+        order = __stratified_order(order, labels[first] if groups is not None else labels, rng)
+
+    if groups is not None:
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        # items are ordered group by group and cut at the group boundaries closest to the ratios
+        boundaries = np.concatenate([[0], np.cumsum(sizes[order])])
+        unseen_ratio, valid_ratio = [int(boundaries[np.argmin(np.abs(boundaries - x))])
+                                     for x in [unseen_ratio, valid_ratio]]
+        if (unseen_test != 0 and unseen_ratio == 0) or valid_ratio == 0 or (valid != 0 and valid_ratio == unseen_ratio):
+            raise InsufficientData(f'Unable to Split data with {len(sizes)} groups')
+        order = np.argsort(rank[group_of], kind='stable')
+
+    if unseen_test != 0:
+        unseen_test, valid, train = np.split(order, [unseen_ratio, valid_ratio])
+        return {'train': train, 'valid': valid, 'unseen_test': unseen_test}
+    valid, train = np.split(order, [valid_ratio])
+    return {'train': train, 'valid': valid}
+
+
+def split_data(data, train=.70, valid=.20, unseen_test=0.0, random=True, seed=None, stratify=None, groups=None):
+    """
+    This method splits the given data into training, validation and unseen testing datasets based on
+    the splitting ratio provided as an input for each dataset.
+       Args:
+           data: List or numpy array
+           train: number of percent data that needs to be considered for training
+           valid: number of percent data that needs to be considered for valid
+           unseen_test: number of percent data that needs to be considered for unseen_test
+           random: if True it will randomly shuffle data
+           seed: seed or numpy Generator used to shuffle data, see split_indices
+           stratify: class label of every item, see split_indices
+           groups: group of every item, see split_indices
 
-        return Dataset({'train': train,
-                        'valid': valid})
+           train, valid, unseen_test values must be greater than 0 and less than 1.
+           sum of teh train, valid, unseen_test values must be greater 1.
+       Return:
+           Dataset object with the train, valid, unseen_test numpy arrays based on the splitting ratio.
+       """
+    indices = split_indices(len(data), train=train, valid=valid, unseen_test=unseen_test, random=random, seed=seed,
+                            stratify=stratify, groups=groups)
+    data = np.asarray(data)
+    return Dataset({k: data[v] for k, v in indices.items()})
 
 
-def split_dataset_from_dir(source_path, target_path, train=0.7, unseen_test=0.3, valid=0.0, random=True):
+def get_yolo_strata(files, label_path, cache=False):
+    """
+    This method returns the class label used to stratify every image of a YOLO dataset, which is the rarest
+    class of the dataset found in its label file, or -1 for images without labels.
+       Args:
+           files: list of image file names
+           label_path: path of the YOLO label directory
+           cache: reuses parsed labels of previous calls if True
+       Return:
+           <numpy.ndarray> class label of every file.
+       """
+    annotations = read_label_dir(label_path, cache=cache)
+    class_ids = [annotations.get(os.path.splitext(file)[0] + '.txt', np.empty((0, 5)))[:, 0].astype(np.int64)
+                 for file in files]
+    present = [x for x in class_ids if len(x)]
+    counts = np.bincount(np.concatenate(present)) if present else np.zeros(0, dtype=np.int64)
+    return np.array([x[np.argmin(counts[x])] if len(x) else -1 for x in class_ids], dtype=np.int64)
+
+
+def __write_shards(source_path, target_path, files, label_path=None):
+    labels = read_label_dir(label_path) if label_path else {}
+    with ShardWriter(target_path) as writer:
+        for file in files:
+            with open(os.path.join(source_path, file), 'rb') as f:
+                data = f.read()
+            writer.write(file, data, labels.get(os.path.splitext(file)[0] + '.txt') if label_path else None)
+
+
+def split_dataset_from_dir(source_path, target_path, train=0.7, unseen_test=0.3, valid=0.0, random=True,
+                           copy_mode='copy', seed=None, label_path=None, group_by=None, target_format='files',
+                           dedup=None, dedup_radius=4):
     """
     This method takes source directory path and splits the given data into training, validation and unseen testing
     datasets based on the splitting ratio provided as an input for each dataset and saves in the target directory.
@@ -59,6 +145,16 @@ def split_dataset_from_dir(source_path, target_path, train=0.7, unseen_test=0.3,
            train: number of percent data that needs to be considered for training
            valid: number of percent data that needs to be considered for valid
            unseen_test: number of percent data that needs to be considered for unseen_test
+           copy_mode: 'copy', 'hardlink', 'symlink' or 'reflink', how files are saved to target_path
+           seed: seed used to shuffle files, the split is reproducible for a given seed
+           label_path: path of the YOLO label directory, if given the split is stratified by class
+           group_by: function returning the group of a file name, files of a group end up in the same dataset
+           target_format: 'files' saves the files of every dataset to a folder, 'shards' packs them with their
+                          labels (if label_path is given) into shards, see mlutils.data.shards
+           dedup: 'group' keeps duplicate images in the same dataset, 'filter' only keeps the first image (by name)
+                  of every cluster of duplicates, see mlutils.data.dedup.find_duplicates
+           dedup_radius: maximum Hamming distance of the perceptual hashes of near duplicates, None for exact
+                         duplicates only
 
            train, valid, unseen_test values must be greater than 0 and less than 1.
            sum of teh train, valid, unseen_test values must be greater 1.
@@ -66,9 +162,118 @@ def split_dataset_from_dir(source_path, target_path, train=0.7, unseen_test=0.3,
     make_dir(target_path)
     if os.path.exists(source_path):
         files = get_files_from_dir(source_path)
-        data = split_data(files, train=train, valid=valid, unseen_test=unseen_test, random=random)
-        copy_file(source_path, os.path.join(target_path, 'train'), files=data.train)
-        copy_file(source_path, os.path.join(target_path, 'valid'), files=data.valid)
-        copy_file(source_path, os.path.join(target_path, 'test'), files=data.unseen_test)
+        groups = [group_by(file) for file in files] if group_by else None
+        if dedup is not None:
+            if dedup not in ('group', 'filter'):
+                raise InvalidConfiguration(f'"dedup" must be "group" or "filter", got "{dedup}"')
+            clusters = find_duplicates([os.path.join(source_path, file) for file in files], radius=dedup_radius)
+            clusters = [[os.path.basename(path) for path in cluster] for cluster in clusters]
+            if dedup == 'filter':
+                dropped = {file for cluster in clusters for file in cluster[1:]}
+                kept = [i for i, file in enumerate(files) if file not in dropped]
+                files = [files[i] for i in kept]
+                groups = [groups[i] for i in kept] if groups is not None else None
+            else:
+                groups = group_duplicates(files, clusters, groups)
+        stratify = get_yolo_strata(files, label_path) if label_path else None
+        data = split_data(files, train=train, valid=valid, unseen_test=unseen_test, random=random, seed=seed,
+                          stratify=stratify, groups=groups)
+        for split, split_files in [('train', data.train), ('valid', data.valid), ('test', data.unseen_test)]:
+            if target_format == 'shards':
+                __write_shards(source_path, os.path.join(target_path, split), split_files, label_path)
+            else:
+                copy_file(source_path, os.path.join(target_path, split), files=split_files, mode=copy_mode)
+    else:
+        raise DirectoryNotFound(f'Unable to find source directory', source_path)
+
+
+def __hash_fraction(source_path, file, hash_by):
+    if hash_by == 'content':
+        digest = hashlib.sha1()
+        with open(os.path.join(source_path, file), 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
     else:
-        raise DirectoryNotFound(f'Unable to find source directory', source_path)
\ No newline at end of file
+        digest = hashlib.sha1(file.encode())
+    return int(digest.hexdigest()[:15], 16) / 16 ** 15
+
+
+def split_dataset_by_hash(source_path, target_path, train=0.7, unseen_test=0.3, valid=0.0, hash_by='name',
+                          copy_mode='copy'):
+    """
+    This method splits the files of source directory into training, validation and unseen testing datasets
+    based on a stable hash of every file, so a file always ends up in the same dataset. The assignment is
+    recorded in a manifest under target_path, running it again only copies the files which were added or
+    modified since the previous run and deletes the files which were removed from the source directory.
+       Args:
+           source_path: path for source directory.
+           target_path: path of target directory
+           train: number of percent data that needs to be considered for training
+           valid: number of percent data that needs to be considered for valid
+           unseen_test: number of percent data that needs to be considered for unseen_test
+           hash_by: 'name' hashes the file name, 'content' hashes the file content
+           copy_mode: 'copy', 'hardlink', 'symlink' or 'reflink', how files are saved to target_path
+
+           train, valid, unseen_test values must be greater than 0 and less than 1.
+           sum of teh train, valid, unseen_test values must be greater 1.
+       Return:
+           <dict> number of added, updated, moved, removed and unchanged files.
+       """
+    if train >= 1 or valid >= 1 or unseen_test >= 1 or not math.isclose(sum([train, valid, unseen_test]), 1):
+        raise InvalidSplittingValues({'train': train, 'valid': valid, 'unseen_test': unseen_test})
+    if hash_by not in ('name', 'content'):
+        raise InvalidConfiguration(f'"hash_by" must be "name" or "content", got "{hash_by}"')
+    if not os.path.exists(source_path):
+        raise DirectoryNotFound('Unable to find source directory', source_path)
+    make_dir(target_path)
+    manifest_path = os.path.join(target_path, '.split_manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    entries = manifest.get('files', {})
+    rehash = manifest.get('hash_by') != hash_by
+
+    summary = {'added': 0, 'updated': 0, 'moved': 0, 'removed': 0, 'unchanged': 0}
+    transfers = {'train': [], 'valid': [], 'test': []}
+    files = {}
+    with os.scandir(source_path) as scan:
+        stats = {entry.name: entry.stat() for entry in scan if entry.is_file()}
+    for file, stat in stats.items():
+        entry = entries.get(file)
+        modified = entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns
+        # name hashes never change, content hashes only when the file is modified
+        if entry is None or rehash or (modified and hash_by == 'content'):
+            fraction = __hash_fraction(source_path, file, hash_by)
+        else:
+            fraction = entry['hash']
+        split = 'test' if fraction < unseen_test else 'valid' if fraction < unseen_test + valid else 'train'
+        files[file] = {'split': split, 'hash': fraction, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if entry is None:
+            summary['added'] += 1
+        elif entry['split'] != split:
+            previous = os.path.join(target_path, entry['split'], file)
+            if os.path.lexists(previous):
+                os.remove(previous)
+            summary['moved'] += 1
+        elif modified:
+            summary['updated'] += 1
+        else:
+            summary['unchanged'] += 1
+            continue
+        transfers[split].append(file)
+    for file in set(entries) - set(files):
+        target = os.path.join(target_path, entries[file]['split'], file)
+        if os.path.lexists(target):
+            os.remove(target)
+        summary['removed'] += 1
+
+    for split, split_files in transfers.items():
+        if split_files:
+            copy_file(source_path, os.path.join(target_path, split), files=split_files, mode=copy_mode,
+                      skip_identical=False)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'hash_by': hash_by, 'files': files}, f)
+    os.replace(tmp_path, manifest_path)
+    return summary
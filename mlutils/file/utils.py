@@ -1,11 +1,22 @@
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 from os.path import join
 
-from tqdm import tqdm
-
+from mlutils import instrumentation
 from mlutils.exceptions import DirectoryNotFound, FileNotFound
+from mlutils.lazy import lazy_import
+
+tqdm = lazy_import('tqdm')
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+TRANSFER_MODES = ('copy', 'hardlink', 'symlink', 'reflink')
+__FICLONE = 0x40049409
 
 
 def get_files_from_dir(dir):
@@ -32,7 +43,92 @@ def file_exists(path):
         raise FileNotFound(f'Unable to find required file', file_path=path)
 
 
-def copy_file(source_path, target_path, files=None):
+def __is_identical(source, target):
+    try:
+        source_stat, target_stat = os.stat(source), os.stat(target)
+    except FileNotFoundError:
+        return False
+    return source_stat.st_size == target_stat.st_size and source_stat.st_mtime_ns == target_stat.st_mtime_ns
+
+
+def __reflink(source, target):
+    if fcntl is None:
+        raise OSError('reflink is not supported on this platform')
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        fcntl.ioctl(target_file.fileno(), __FICLONE, source_file.fileno())
+    shutil.copystat(source, target)
+
+
+def __transfer(source, target, mode):
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        if mode == 'hardlink':
+            os.link(source, target)
+        elif mode == 'symlink':
+            os.symlink(os.path.abspath(source), target)
+        elif mode == 'reflink':
+            __reflink(source, target)
+        else:
+            shutil.copy2(source, target)
+        return mode
+    except OSError:
+        # links fail across file systems and reflinks on file systems without copy on write support
+        if mode in ('copy', 'symlink'):
+            raise
+        if os.path.lexists(target):
+            os.remove(target)
+        shutil.copy2(source, target)
+        return 'copy'
+
+
+def __transfer_file(source, target, mode, skip_identical, dry_run):
+    # the identity check stats both files, it runs in the worker threads with the transfer
+    if skip_identical and __is_identical(source, target):
+        return 'skip'
+    return mode if dry_run else __transfer(source, target, mode)
+
+
+@instrumentation.timed('file.transfer_files')
+def transfer_files(source_path, target_path, files=None, mode='copy', workers=8, skip_identical=True, dry_run=False):
+    """
+    This method transfers files from source_path to target_path with a pool of threads.
+    Args:
+        source_path: <string> path for source dir.
+        target_path: <string> path of target dir.
+        files: <list> list of files to be transferred from source to target, all files of source if None.
+        mode: <string> 'copy', 'hardlink', 'symlink' or 'reflink'. Hardlinks and reflinks fall back to a copy
+              when the file system doesn't support them.
+        workers: <int> number of threads transferring files.
+        skip_identical: <boolean> skips files whose target already has the same size and modification time.
+        dry_run: <boolean> only plans the transfer, nothing is written if True.
+    Returns:
+        plan: <list> (source, target, action) of every file, action is 'skip' or the mode used for the file.
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f'Unsupported transfer mode "{mode}", expected one of {TRANSFER_MODES}')
+    if files is None:
+        files = get_files_from_dir(source_path)
+    pairs = [(os.path.join(source_path, file), os.path.join(target_path, os.path.basename(file))) for file in files]
+    if not dry_run:
+        make_dir(target_path)
+    plan = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        actions = executor.map(lambda x: __transfer_file(x[0], x[1], mode, skip_identical, dry_run), pairs)
+        for (source, target), action in tqdm.tqdm(zip(pairs, actions), total=len(pairs), disable=dry_run,
+                                                  desc=f"Copying files to {target_path.split('/')[-1]}"):
+            plan.append((source, target, action))
+    if dry_run:
+        return plan
+    for _, _, action in plan:
+        instrumentation.count(f'file.{action}')
+    if instrumentation.is_enabled():
+        instrumentation.count('file.bytes_copied', sum(os.path.getsize(source) for source, _, action in plan
+                                                       if action == 'copy'))
+    return plan
+
+
+def copy_file(source_path, target_path, files=None, mode='copy', workers=8, skip_identical=True, dry_run=False):
     """
     This is method copies files from source_path to target_path,
     if files are not mentioned then all files from source is copied to target
@@ -40,10 +136,12 @@ def copy_file(source_path, target_path, files=None):
         source_path: <string> path for source dir.
         target_path: <string> path of target dir.
         files: <list> list of files to be copied from source to target.
+        mode: <string> 'copy', 'hardlink', 'symlink' or 'reflink', see transfer_files.
+        workers: <int> number of threads copying files.
+        skip_identical: <boolean> skips files whose target already has the same size and modification time.
+        dry_run: <boolean> only plans the copy, nothing is written if True.
+    Returns:
+        plan: <list> (source, target, action) of every file, see transfer_files.
     """
-
-    make_dir(target_path)
-    if files is None:
-        files = get_files_from_dir(source_path)
-    for file in tqdm(files, desc=f"Copying files to {target_path.split('/')[-1]}"):
-        shutil.copy(os.path.join(source_path, file), target_path)
\ No newline at end of file
+    return transfer_files(source_path, target_path, files=files, mode=mode, workers=workers,
+                          skip_identical=skip_identical, dry_run=dry_run)
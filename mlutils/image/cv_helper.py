@@ -1,10 +1,17 @@
-import cv2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
-from scipy.ndimage import interpolation as inter
 
 from mlutils.exceptions import MissingRequiredParameterException
+from mlutils.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+inter = lazy_import('scipy.ndimage')
+optimize = lazy_import('scipy.optimize')
 
-__all__ = ['get_object', 'calculate_iou', 'get_skew_angel', 'fix_skew', 'match_template']
+__all__ = ['get_object', 'get_objects', 'clip_boxes', 'calculate_iou', 'calculate_iou_matrix', 'non_max_suppression',
+           'match_boxes', 'apply_bbox_padding', 'apply_bbox_paddings',
+           'estimate_skew_angle', 'get_skew_angel', 'fix_skew', 'match_template', 'TemplateBank']
 
 
 def get_object(target_img, coordinates, label):
@@ -28,6 +35,62 @@ def get_object(target_img, coordinates, label):
     return {'detected_object': cropped_img, 'label': label}
 
 
+def clip_boxes(boxes, shape):
+    """
+    Parameters:
+        boxes <class 'numpy.ndarray'>: (N, 4) array of (x0, y0, x1, y1) pixel coordinates.
+        shape <tuple>: The shape of the image, (height, width, ...).
+    Returns:
+        <class 'numpy.ndarray'>: (N, 4) array of the boxes clipped to the image bounds.
+    """
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    return np.clip(boxes, 0, [shape[1], shape[0], shape[1], shape[0]])
+
+
+def get_objects(target_img, coordinates, labels=None, padding=0.005, pack=False, size=None, fill=0):
+    """
+    Crops many objects at once, every box is padded like get_object and clipped to the image bounds.
+    Parameters:
+        target_img <class 'numpy.ndarray'>: The target image which is to be cropped.
+        coordinates <class 'numpy.ndarray'>: (N, 4) array of (x0, y0, x1, y1) pixel coordinates.
+        labels <list>: The label of every box.
+        padding <float>: The padding relative to the image size, 0.005 is the padding of get_object.
+        pack <bool>: If True, copies the crops into a single batch array instead of returning views of target_img.
+        size <tuple>: (width, height) every crop is resized to when packed, by default crops are padded with fill
+                      to the size of the largest crop.
+        fill <int>: The value of the batch array outside of the crops.
+    Returns:
+        <list>: {'detected_object': crop, 'label': label} of every box, where every crop is a view of target_img.
+        <dict>: If pack is True, batch (N, height, width, ...) array, sizes (N, 2) array of the (height, width)
+                of every crop in the batch, boxes (N, 4) array of the clipped boxes and labels.
+    """
+    boxes = np.trunc(np.asarray(coordinates, dtype=np.float64).reshape(-1, 4))
+    # same padding as get_object, which pads x0, y0 by the height and x1, y1 by the width of the image
+    h_pad, w_pad = target_img.shape[0] * padding, target_img.shape[1] * padding
+    boxes = np.trunc(boxes + np.array([-h_pad, -h_pad, w_pad, w_pad]))
+    boxes = clip_boxes(boxes.astype(np.int64), target_img.shape)
+    labels = list(labels) if labels is not None else [None] * len(boxes)
+    crops = [target_img[y0:y1, x0:x1] for x0, y0, x1, y1 in boxes]
+    if not pack:
+        return [{'detected_object': crop, 'label': label} for crop, label in zip(crops, labels)]
+
+    sizes = np.stack([boxes[:, 3] - boxes[:, 1], boxes[:, 2] - boxes[:, 0]], axis=1).clip(0, None)
+    if size is not None:
+        width, height = size
+    else:
+        height, width = sizes.max(axis=0) if len(sizes) else (0, 0)
+    batch = np.full((len(boxes), height, width) + target_img.shape[2:], fill, dtype=target_img.dtype)
+    for i, crop in enumerate(crops):
+        if not crop.size:
+            sizes[i] = 0
+        elif size is not None:
+            batch[i] = cv2.resize(crop, (width, height), interpolation=cv2.INTER_AREA).reshape(batch.shape[1:])
+            sizes[i] = height, width
+        else:
+            batch[i, :crop.shape[0], :crop.shape[1]] = crop
+    return {'batch': batch, 'sizes': sizes, 'boxes': boxes, 'labels': labels}
+
+
 def calculate_iou(x, y):
     x0 = max(x[0], y[0])
     y0 = max(x[1], y[1])
@@ -40,6 +103,94 @@ def calculate_iou(x, y):
     return iou
 
 
+def calculate_iou_matrix(boxes_a, boxes_b, pixel_offset=1):
+    """
+    Parameters:
+        boxes_a <class 'numpy.ndarray'>: (N, 4) array of (x0, y0, x1, y1) boxes.
+        boxes_b <class 'numpy.ndarray'>: (M, 4) array of (x0, y0, x1, y1) boxes.
+        pixel_offset <int>: Added to widths and heights, 1 treats coordinates as inclusive pixel indices like
+                            calculate_iou, 0 treats them as continuous coordinates.
+    Returns:
+        iou <class 'numpy.ndarray'>: (N, M) array of the IoU of every pair of boxes.
+    """
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter_area = np.clip(x1 - x0 + pixel_offset, 0, None) * np.clip(y1 - y0 + pixel_offset, 0, None)
+    a_area = (a[:, 2] - a[:, 0] + pixel_offset) * (a[:, 3] - a[:, 1] + pixel_offset)
+    b_area = (b[:, 2] - b[:, 0] + pixel_offset) * (b[:, 3] - b[:, 1] + pixel_offset)
+    union = a_area[:, None] + b_area[None, :] - inter_area
+    return np.divide(inter_area, union, out=np.zeros_like(inter_area), where=union > 0)
+
+
+def non_max_suppression(boxes, scores, iou_threshold=0.5, class_ids=None, pixel_offset=1):
+    """
+    Parameters:
+        boxes <class 'numpy.ndarray'>: (N, 4) array of (x0, y0, x1, y1) boxes.
+        scores <class 'numpy.ndarray'>: (N,) array of confidence scores.
+        iou_threshold <float>: Boxes overlapping a better scored box by more than this IoU are suppressed.
+        class_ids <class 'numpy.ndarray'>: (N,) array of class ids, if given boxes only suppress boxes of their
+                                           own class.
+        pixel_offset <int>: See calculate_iou_matrix.
+    Returns:
+        keep <class 'numpy.ndarray'>: Indices of the kept boxes, sorted by decreasing score.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if class_ids is not None and len(boxes):
+        # shifting every class to its own region keeps boxes of different classes from overlapping
+        offsets = np.asarray(class_ids, dtype=np.float64) * (boxes.max() - boxes.min() + pixel_offset + 1)
+        boxes = boxes + offsets[:, None]
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    keep = []
+    while len(order):
+        best = order[0]
+        keep.append(best)
+        ious = calculate_iou_matrix(boxes[best], boxes[order[1:]], pixel_offset)[0]
+        order = order[1:][ious <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def match_boxes(predictions, ground_truths, iou_threshold=0.5, method='greedy', pixel_offset=1):
+    """
+    Matches predicted boxes to ground truth boxes, every box is matched at most once.
+    Parameters:
+        predictions <class 'numpy.ndarray'>: (N, 4) array of predicted (x0, y0, x1, y1) boxes.
+        ground_truths <class 'numpy.ndarray'>: (M, 4) array of ground truth (x0, y0, x1, y1) boxes.
+        iou_threshold <float>: The minimum IoU of a match.
+        method <str>: 'greedy' matches the pairs with the highest IoU first, 'hungarian' maximizes the total IoU.
+        pixel_offset <int>: See calculate_iou_matrix.
+    Returns:
+        <dict>: matches (K, 2) array of (prediction index, ground truth index), ious (K,) array of their IoU,
+                unmatched_predictions and unmatched_ground_truths arrays of indices.
+    """
+    iou = calculate_iou_matrix(predictions, ground_truths, pixel_offset)
+    if method == 'hungarian':
+        # pairs below the threshold must not compete with valid matches for the assignment
+        rows, cols = optimize.linear_sum_assignment(-np.where(iou >= iou_threshold, iou, 0))
+        valid = iou[rows, cols] >= iou_threshold
+        rows, cols = rows[valid], cols[valid]
+    elif method == 'greedy':
+        candidates = np.flatnonzero(iou >= iou_threshold)
+        candidates = candidates[np.argsort(-iou.ravel()[candidates], kind='stable')]
+        used_rows, used_cols = np.zeros(iou.shape[0], dtype=bool), np.zeros(iou.shape[1], dtype=bool)
+        rows, cols = [], []
+        for row, col in zip(*np.unravel_index(candidates, iou.shape)):
+            if not used_rows[row] and not used_cols[col]:
+                used_rows[row] = used_cols[col] = True
+                rows.append(row)
+                cols.append(col)
+        rows, cols = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+    else:
+        raise ValueError(f'Unsupported matching method "{method}"')
+    return {'matches': np.stack([rows, cols], axis=1).reshape(-1, 2),
+            'ious': iou[rows, cols],
+            'unmatched_predictions': np.setdiff1d(np.arange(iou.shape[0]), rows),
+            'unmatched_ground_truths': np.setdiff1d(np.arange(iou.shape[1]), cols)}
+
+
 def __find_skew_score(arr, angle):
     data = inter.rotate(arr, angle, reshape=False, order=0)
     histogram = np.sum(data, axis=1)
@@ -59,9 +210,72 @@ def __calculate_skew_angel(image, delta=5, limit=45):
     return best_angle
 
 
-def get_skew_angel(extracted_objects):
-    find_skew_angles = [__calculate_skew_angel(extracted_object['detected_object']) for extracted_object in
-                        extracted_objects]
+def __threshold(image, max_size=None):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    if max_size and max(gray.shape[:2]) > max_size:
+        scale = max_size / max(gray.shape[:2])
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+
+def __projection_score(thresh, angle):
+    (h, w) = thresh.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    rotated = cv2.warpAffine(thresh, M, (w, h), flags=cv2.INTER_NEAREST)
+    histogram = np.sum(rotated, axis=1, dtype=np.float64)
+    return np.sum(np.diff(histogram) ** 2)
+
+
+def estimate_skew_angle(image, limit=45, delta=5, precision=0.1, max_size=512):
+    """
+    Estimates the skew angle of an image with a coarse to fine search of the angle which maximizes the
+    sharpness of the horizontal projection profile, on a copy of the image downscaled to max_size.
+    Parameters:
+        image <class 'numpy.ndarray'>: The input BGR or grayscale image.
+        limit <float>: The maximum absolute angle searched.
+        delta <float>: The step of the coarse search.
+        precision <float>: The step of the finest search.
+        max_size <int>: The maximum width or height of the image used for the search, None keeps the full size.
+    Returns:
+        <float>: The angle to be passed to fix_skew to deskew the image.
+    """
+    thresh = __threshold(image, max_size)
+    angles = np.arange(-limit, limit + delta, delta)
+    while True:
+        scores = [__projection_score(thresh, angle) for angle in angles]
+        # ties are resolved in favour of the smallest rotation
+        best_angle = float(angles[np.lexsort((np.abs(angles), -np.array(scores)))[0]])
+        if delta <= precision:
+            return round(best_angle, 6) + 0.0
+        fine_delta = max(delta / 5, precision)
+        angles = np.arange(best_angle - delta + fine_delta, best_angle + delta, fine_delta)
+        delta = fine_delta
+
+
+def get_skew_angel(extracted_objects, precision=0.1, workers=None, method='coarse_to_fine'):
+    """
+    Parameters:
+        extracted_objects <class 'list'>: The objects returned by get_object.
+        precision <float>: The precision of the estimated angle.
+        workers <int>: The number of threads estimating the angle of the objects in parallel.
+        method <str>: 'coarse_to_fine' uses estimate_skew_angle, 'exhaustive' rotates the full size object for
+                      every angle in 5 degree steps.
+    Returns:
+        skew_angle: The angle to be passed to fix_skew to deskew the image.
+    """
+    if method == 'exhaustive':
+        estimate = __calculate_skew_angel
+    elif method == 'coarse_to_fine':
+        def estimate(image):
+            return estimate_skew_angle(image, precision=precision)
+    else:
+        raise ValueError(f'Unsupported skew estimation method "{method}"')
+    images = [extracted_object['detected_object'] for extracted_object in extracted_objects]
+    if workers and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            find_skew_angles = list(executor.map(estimate, images))
+    else:
+        find_skew_angles = [estimate(image) for image in images]
     skew_angles = find_skew_angles
     max_skew_angle = np.max(skew_angles)
     min_skew_angle = np.min(skew_angles)
@@ -91,13 +305,106 @@ def match_template(template, image, threshold=0.9):
     """
     if template is None:
         raise MissingRequiredParameterException('Missing Required input Template Parameter for Template Matching')
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    match = cv2.matchTemplate(gray_image, template, cv2.TM_CCOEFF_NORMED)
-    if match.all() >= threshold:
+    match = cv2.matchTemplate(_to_gray(image), _to_gray(template), cv2.TM_CCOEFF_NORMED)
+    if match.max() >= threshold:
         return True
     return False
 
 
+def _to_gray(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def _match_scaled_templates(gray_image, scaled_templates):
+    best = None
+    for scale, template in scaled_templates:
+        if template.shape[0] > gray_image.shape[0] or template.shape[1] > gray_image.shape[1]:
+            continue
+        match = cv2.matchTemplate(gray_image, template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, location = cv2.minMaxLoc(match)
+        if best is None or score > best['score']:
+            best = {'score': score, 'location': location, 'scale': scale,
+                    'size': (template.shape[1], template.shape[0])}
+    return best
+
+
+class TemplateBank:
+    """
+    Stores templates preprocessed once (grayscale and optionally rescaled) and matches all of them against an image
+    which is converted to grayscale only once.
+    Parameters:
+        templates <class 'dict'>: Template name as key and template image as value.
+        scales <class 'tuple'>: Scales at which every template is searched, e.g. (0.8, 1.0, 1.25).
+        workers <int>: Number of threads matching templates in parallel.
+    """
+
+    def __init__(self, templates=None, scales=(1.0,), workers=None):
+        self.scales = tuple(scales)
+        self.workers = workers
+        self.templates = {}
+        for name, template in (templates or {}).items():
+            self.add(name, template)
+
+    def add(self, name, template):
+        """
+        Parameters:
+            name <str>: The name of the template.
+            template <class 'numpy.ndarray'>: The template image.
+        """
+        if template is None:
+            raise MissingRequiredParameterException('Missing Required input Template Parameter for Template Matching')
+        gray = _to_gray(template)
+        self.templates[name] = [(scale, gray if scale == 1 else cv2.resize(
+            gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR))
+                                for scale in self.scales]
+
+    def match(self, image, threshold=None, early_exit=False):
+        """
+        Parameters:
+            image <class 'numpy.ndarray'>: The input image where the search is running.
+            threshold <float>: The score of a confident match.
+            early_exit <bool>: If True, stops matching templates after the first confident match.
+        Returns:
+            <dict>: Template name as key and its best match as value, a dict of score, location (x, y) of the top
+                    left corner, scale and size (w, h) of the matched template, or None if the template is larger
+                    than the image. With early_exit, templates which were not matched are missing.
+        """
+        gray_image = _to_gray(image)
+        stop = early_exit and threshold is not None
+        results = {}
+        if self.workers and self.workers > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(_match_scaled_templates, gray_image, templates): name
+                           for name, templates in self.templates.items()}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    if stop and results[futures[future]] and results[futures[future]]['score'] >= threshold:
+                        for pending in futures:
+                            pending.cancel()
+                        break
+            return results
+        for name, templates in self.templates.items():
+            results[name] = _match_scaled_templates(gray_image, templates)
+            if stop and results[name] and results[name]['score'] >= threshold:
+                break
+        return results
+
+    def best_match(self, image, threshold=0.9, early_exit=False):
+        """
+        Parameters:
+            image <class 'numpy.ndarray'>: The input image where the search is running.
+            threshold <float>: The minimum score of a match.
+            early_exit <bool>: If True, returns the first confident match instead of the best one.
+        Returns:
+            <tuple>: The template name and its match, or None if no template matches the image.
+        """
+        matches = [(name, match) for name, match in self.match(image, threshold, early_exit).items() if match]
+        if not matches:
+            return None
+        name, match = max(matches, key=lambda x: x[1]['score'])
+        return (name, match) if match['score'] >= threshold else None
+
+
 def apply_bbox_padding(page_dim, input_bbox, x0_pad=0.0, y0_pad=0.0, x1_pad=0.0, y1_pad=0.0):
     """
         applies padding to the input bounding box relative to the page size.
@@ -117,3 +424,23 @@ def apply_bbox_padding(page_dim, input_bbox, x0_pad=0.0, y0_pad=0.0, x1_pad=0.0,
     x0, y0 = x0 + w * x0_pad, y0 + h * y0_pad
     x1, y1 = x1 + w * x1_pad, y1 + h * y1_pad
     return x0, y0, x1, y1
+
+
+def apply_bbox_paddings(page_dim, input_bboxes, x0_pad=0.0, y0_pad=0.0, x1_pad=0.0, y1_pad=0.0, clip=False):
+    """
+        applies padding to many bounding boxes relative to the page size, see apply_bbox_padding.
+        Parameters:
+          page_dim <tuple> : The page dimension of page for relative padding to bounding box.
+          input_bboxes <class 'numpy.ndarray'> : (N, 4) array of the input bounding boxes to be padded.
+          x0_pad, y0_pad, x1_pad, y1_pad <float> : The input percentage relative to page size to be padded
+          clip <bool> : If True, the padded bounding boxes are clipped to the page dimension.
+        Returns:
+         <class 'numpy.ndarray'> : (N, 4) array of the output padded bounding boxes
+    """
+    w = page_dim[2]
+    h = page_dim[3]
+    bboxes = np.asarray(input_bboxes, dtype=np.float64).reshape(-1, 4) + np.array(
+        [w * x0_pad, h * y0_pad, w * x1_pad, h * y1_pad])
+    if clip:
+        bboxes = np.clip(bboxes, [page_dim[0], page_dim[1]] * 2, [w, h] * 2)
+    return bboxes
@@ -1,3 +1,10 @@
+import os
+
+from mlutils.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+
 def check_minimum_dimension(image, min_width=320, min_height=320):
     """
     This is which check if the image is bigger than the minimum dimension.
@@ -14,3 +21,134 @@ def check_minimum_dimension(image, min_width=320, min_height=320):
             return True
         return False
     return None
+
+
+def check_minimum_size(size, min_width=320, min_height=320):
+    """
+    This is which check if the image size is bigger than the minimum dimension, see check_minimum_dimension.
+    Args:
+        size: <tuple> (width, height) of the image, as returned by get_image_size.
+        min_width: <int> the minimum width for valid image.
+        min_height: <int> the minimum height for valid image.
+    Returns:
+        <Boolean> or None: True If image is bigger than the minimum dimensions else False and None if size is None
+    """
+    if size is not None:
+        width, height = size
+        return width >= min_width and height >= min_height
+    return None
+
+
+def __read_exact(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError('Unexpected end of file')
+    return data
+
+
+def __jpeg_orientation(segment):
+    # segment is the content of an APP1 marker: b'Exif\0\0' followed by a TIFF structure
+    if segment[:6] != b'Exif\x00\x00':
+        return 1
+    tiff = segment[6:]
+    byte_order = 'little' if tiff[:2] == b'II' else 'big'
+    offset = int.from_bytes(tiff[4:8], byte_order)
+    count = int.from_bytes(tiff[offset:offset + 2], byte_order)
+    for i in range(count):
+        entry = tiff[offset + 2 + i * 12:offset + 14 + i * 12]
+        if int.from_bytes(entry[:2], byte_order) == 0x0112:
+            return int.from_bytes(entry[8:10], byte_order)
+    return 1
+
+
+def __jpeg_size(file):
+    orientation = 1
+    __read_exact(file, 2)
+    while True:
+        marker = __read_exact(file, 2)
+        while marker[1] == 0xFF:
+            marker = marker[1:] + __read_exact(file, 1)
+        if marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            return None
+        length = int.from_bytes(__read_exact(file, 2), 'big')
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = __read_exact(file, 5)
+            height, width = int.from_bytes(data[1:3], 'big'), int.from_bytes(data[3:5], 'big')
+            # OpenCV applies the EXIF orientation, orientations 5 to 8 swap width and height
+            return (height, width) if orientation >= 5 else (width, height)
+        if code == 0xE1 and orientation == 1:
+            orientation = __jpeg_orientation(__read_exact(file, length - 2))
+        else:
+            file.seek(length - 2, os.SEEK_CUR)
+
+
+def __tiff_size(file, header):
+    byte_order = 'little' if header[:2] == b'II' else 'big'
+    file.seek(int.from_bytes(header[4:8], byte_order))
+    count = int.from_bytes(__read_exact(file, 2), byte_order)
+    entries = __read_exact(file, count * 12)
+    size = {}
+    for i in range(count):
+        entry = entries[i * 12:(i + 1) * 12]
+        tag, value_type = int.from_bytes(entry[:2], byte_order), int.from_bytes(entry[2:4], byte_order)
+        if tag in (256, 257):
+            value = entry[8:10] if value_type == 3 else entry[8:12]
+            size[tag] = int.from_bytes(value, byte_order)
+    return (size[256], size[257]) if len(size) == 2 else None
+
+
+def __webp_size(header):
+    chunk = header[12:16]
+    if chunk == b'VP8 ':
+        return (int.from_bytes(header[26:28], 'little') & 0x3FFF,
+                int.from_bytes(header[28:30], 'little') & 0x3FFF)
+    if chunk == b'VP8L':
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+    return None
+
+
+def __probe_size(path):
+    with open(path, 'rb') as file:
+        header = file.read(32)
+        if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+            return int.from_bytes(header[16:20], 'big'), int.from_bytes(header[20:24], 'big')
+        if header[:2] == b'BM':
+            if int.from_bytes(header[14:18], 'little') == 12:
+                return int.from_bytes(header[18:20], 'little'), int.from_bytes(header[20:22], 'little')
+            return (abs(int.from_bytes(header[18:22], 'little', signed=True)),
+                    abs(int.from_bytes(header[22:26], 'little', signed=True)))
+        if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+            return __webp_size(header)
+        if header[:4] in (b'II*\x00', b'MM\x00*'):
+            return __tiff_size(file, header)
+        if header[:2] == b'\xff\xd8':
+            file.seek(0)
+            return __jpeg_size(file)
+    return None
+
+
+def get_image_size(path):
+    """
+    This is which reads the size of an image from its header without decoding it. JPEG, PNG, BMP, TIFF and WebP
+    headers are supported, other formats or unreadable headers fall back to decoding the image with OpenCV.
+    Args:
+        path: <string> path of the image.
+    Returns:
+        <tuple> or None: (width, height) of the image and None if the image can't be read.
+    """
+    try:
+        size = __probe_size(path)
+    except (OSError, ValueError, IndexError):
+        size = None
+    if size is None:
+        image = cv2.imread(path, 0)
+        size = (image.shape[1], image.shape[0]) if image is not None else None
+    return size
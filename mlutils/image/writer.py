@@ -0,0 +1,164 @@
+import io
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+import numpy as np
+
+from mlutils import instrumentation
+from mlutils.lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+__all__ = ['IMAGE_FORMATS', 'encode_image', 'decode_image', 'write_atomic', 'ImageWriter']
+
+IMAGE_FORMATS = ('jpg', 'png', 'webp', 'npy')
+_NPY_MAGIC = b'\x93NUMPY'
+
+
+def encode_image(image, image_format='jpg', quality=None, compression=None):
+    """
+    Parameters:
+        image <class 'numpy.ndarray'>: The BGR image to be encoded.
+        image_format <str>: 'jpg', 'png', 'webp' or 'npy' (the raw array, no compression).
+        quality <int>: The JPEG or WebP quality, 0 to 100 (above 100 WebP is lossless). OpenCV's default if None.
+        compression <int>: The PNG compression level, 0 to 9. OpenCV's default if None.
+    Returns:
+        <bytes>: The encoded image.
+    """
+    if image_format == 'npy':
+        buffer = io.BytesIO()
+        np.save(buffer, image, allow_pickle=False)
+        return buffer.getvalue()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unsupported image format "{image_format}", expected one of {IMAGE_FORMATS}')
+    params = []
+    if quality is not None and image_format in ('jpg', 'webp'):
+        params = [cv2.IMWRITE_JPEG_QUALITY if image_format == 'jpg' else cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif compression is not None and image_format == 'png':
+        params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    success, data = cv2.imencode('.' + image_format, image, params)
+    if not success:
+        raise ValueError(f'Unable to encode image as {image_format}')
+    return data.tobytes()
+
+
+def decode_image(data, flags=1):
+    """
+    Parameters:
+        data <bytes or numpy.ndarray>: The image encoded by encode_image.
+        flags <int>: See cv2.imdecode, ignored for npy.
+    Returns:
+        <class 'numpy.ndarray'>: The decoded image.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if data[:len(_NPY_MAGIC)].tobytes() == _NPY_MAGIC:
+        return np.load(io.BytesIO(data.tobytes()), allow_pickle=False)
+    return cv2.imdecode(data, flags)
+
+
+def write_atomic(path, data):
+    """
+    Writes data to a temporary file next to path and renames it, so path is either missing or complete even if the
+    process is interrupted.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ImageWriter:
+    """
+    Encodes and writes images in background threads. Images are handed over through a bounded queue, when the
+    writers fall behind, submit blocks until a slot is free, which bounds the memory held by pending images.
+    Every file is written atomically, see write_atomic.
+    """
+
+    def __init__(self, image_format='jpg', quality=None, compression=None, workers=2, max_pending=None):
+        """
+        Parameters:
+            image_format <str>: 'jpg', 'png', 'webp' or 'npy', see encode_image.
+            quality <int>: The JPEG or WebP quality.
+            compression <int>: The PNG compression level.
+            workers <int>: The number of writer threads.
+            max_pending <int>: The maximum number of images waiting to be written, twice the workers by default.
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f'Unsupported image format "{image_format}", expected one of {IMAGE_FORMATS}')
+        self.image_format = image_format
+        self.quality = quality
+        self.compression = compression
+        self.extension = '.' + image_format
+        self.bytes_written = 0
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue(maxsize=max_pending or 2 * workers)
+        self.__threads = [threading.Thread(target=self.__work, daemon=True) for _ in range(workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def encode(self, image):
+        with instrumentation.stage('writer.encode'):
+            return encode_image(image, self.image_format, self.quality, self.compression)
+
+    def write(self, path, image):
+        """
+        Encodes and writes image in the calling thread.
+        Parameters:
+            path <str>: The path of the file without extension, the extension of the format is appended.
+            image <class 'numpy.ndarray'>: The BGR image.
+        Returns:
+            <str>: The path of the written file.
+        """
+        data = self.encode(image)
+        path += self.extension
+        with instrumentation.stage('writer.write'):
+            write_atomic(path, data)
+        with self.__lock:
+            self.bytes_written += len(data)
+        instrumentation.count('writer.bytes_written', len(data))
+        return path
+
+    def submit(self, path, image):
+        """
+        Queues image to be written by a writer thread, see write. The image must not be modified until it is
+        written, e.g. it must not be a reused buffer.
+        Returns:
+            <class 'concurrent.futures.Future'>: Resolved with the path of the written file.
+        """
+        if not self.__threads:
+            raise RuntimeError('ImageWriter is closed')
+        future = Future()
+        self.__queue.put((path, image, future))
+        return future
+
+    def __work(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            path, image, future = item
+            try:
+                future.set_result(self.write(path, image))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self):
+        """ Waits for the queued images to be written and stops the writer threads """
+        for _ in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
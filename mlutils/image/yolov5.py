@@ -1,23 +1,51 @@
 import os
-import glob
-import shutil
 
-import yaml
-import termtables
-import pandas as pd
-from tqdm import tqdm
+import numpy as np
 
+from mlutils import instrumentation
+from mlutils.data.labels import read_label_dir
 from mlutils.exceptions import UnsupportedObjectType
+from mlutils.file.utils import copy_file
+from mlutils.lazy import lazy_import
 
-__all__ = ['get_bbox_by_label', 'read_label_classes', 'split_dataset_by_labels', 'dataset_summary']
+pd = lazy_import('pandas')
+termtables = lazy_import('termtables')
+tqdm = lazy_import('tqdm')
+yaml = lazy_import('yaml')
 
+__all__ = ['get_detection_arrays', 'get_bbox_by_label', 'read_label_classes', 'index_dataset',
+           'split_dataset_by_labels', 'dataset_summary']
 
-def __copy_file(source_path, target_path, files=None):
-    os.makedirs(target_path, exist_ok=True)
-    if files is None:
-        files = os.listdir(source_path)
-    for file in tqdm(files, desc=f"Copying files to {target_path.split('/')[-1]}"):
-        shutil.copy(os.path.join(source_path, file), target_path)
+
+DETECTION_DTYPE = np.dtype([('bbox', np.float32, (4,)), ('conf', np.float32), ('label', np.int64)])
+
+
+def get_detection_arrays(results):
+    """
+    This method converts results returned by yolov5 detect method to structured numpy arrays, reading the
+    predictions of the Detections object directly instead of going through pandas.
+    Args:
+        results: <class object> result object returned by yolov5 detect method
+    Returns:
+        detections: <list> structured array of every image with 'bbox' (x0, y0, x1, y1), 'conf' and 'label' fields
+        names: <numpy.ndarray> class name of every label
+    """
+    if results.__class__.__name__ != 'Detections':
+        raise UnsupportedObjectType('Input object type is not supported')
+    detections = []
+    for prediction in results.xyxy:
+        if hasattr(prediction, 'detach'):
+            prediction = prediction.detach().cpu().numpy()
+        prediction = np.asarray(prediction, dtype=np.float32).reshape(-1, 6)
+        detection = np.empty(len(prediction), dtype=DETECTION_DTYPE)
+        detection['bbox'] = prediction[:, :4]
+        detection['conf'] = prediction[:, 4]
+        detection['label'] = prediction[:, 5]
+        detections.append(detection)
+    names = results.names
+    if isinstance(names, dict):
+        names = [names.get(i, str(i)) for i in range(max(names, default=-1) + 1)]
+    return detections, np.array(names, dtype=object)
 
 
 def get_bbox_by_label(results):
@@ -30,19 +58,10 @@ def get_bbox_by_label(results):
 
     """
     if results:
-        if results.__class__.__name__ == 'Detections':
-            transformed_results = []
-            for result in results.pandas().xyxy:
-                transformed_result = []
-                for x in result.values:
-                    bbox = tuple(x[:4])
-                    conf = x[-3]
-                    label = int(x[-2])
-                    name = x[-1]
-                    transformed_result.append((name, label, bbox, conf))
-                transformed_results.append(transformed_result)
-            return transformed_results
-        raise UnsupportedObjectType('Input object type is not supported')
+        detections, names = get_detection_arrays(results)
+        return [list(zip(names[detection['label']].tolist(), detection['label'].tolist(),
+                         map(tuple, detection['bbox'].tolist()), detection['conf'].tolist()))
+                for detection in detections]
     return None
 
 
@@ -59,7 +78,41 @@ def read_label_classes(label_path):
     return class_labels
 
 
-def split_dataset_by_labels(image_path, annotation_path, class_labels, target_path=None, save=False):
+@instrumentation.timed('yolov5.index_dataset')
+def index_dataset(image_path, annotation_path, cache=False):
+    """
+    This method indexes a dataset split with a single scan of the image folder, every annotation file is matched
+    to the image with the same file name (without extension).
+    Args:
+        image_path: <string> path to image folder.
+        annotation_path: <string> path to respective annotation folder.
+        cache: <boolean> Reuses parsed annotations of previous calls if True.
+    Returns:
+        index: <dict> returns class id array of every object as value and respective image name as key.
+    """
+    with os.scandir(image_path) as entries:
+        images = {os.path.splitext(entry.name)[0]: entry.name for entry in entries if entry.is_file()}
+    annotations = read_label_dir(annotation_path, cache=cache)
+    index = {}
+    for filename, labels in annotations.items():
+        image_name = images.get(os.path.splitext(filename)[0])
+        if image_name and len(labels):
+            index[image_name] = labels[:, 0].astype(np.int64)
+    instrumentation.count('yolov5.indexed_images', len(index))
+    return index
+
+
+def __count_labels(index, class_count):
+    class_ids = list(index.values())
+    if not class_ids:
+        return np.zeros(class_count, dtype=np.int64), np.zeros(class_count, dtype=np.int64)
+    images = np.bincount(np.concatenate([np.unique(x) for x in class_ids]), minlength=class_count)
+    instances = np.bincount(np.concatenate(class_ids), minlength=class_count)
+    return images, instances
+
+
+def split_dataset_by_labels(image_path, annotation_path, class_labels, target_path=None, save=False, cache=False,
+                            copy_mode='copy'):
     """
     This method splits image dataset by class labels.
     Args:
@@ -68,35 +121,30 @@ def split_dataset_by_labels(image_path, annotation_path, class_labels, target_pa
         class_labels: <list> list of class labels.
         target_path: <string> path to target folder where the sorted images will be saved.
         save: <boolean> Saves images to folder if True.
+        cache: <boolean> Reuses parsed annotations of previous calls if True.
+        copy_mode: <string> 'copy', 'hardlink', 'symlink' or 'reflink', how images are saved to target_path.
     Returns:
         images_per_label: <dict> returns set of image name as value and respective labels as key.
     """
     images_per_label = {k: set() for k in class_labels}
-    for filename in tqdm(os.listdir(annotation_path), 'splitting dataset'):
-        file = os.path.join(annotation_path, filename)
-        if not filename == 'classes.txt':
-            with open(file, "r") as f:
-                lines = f.readlines()
-                for line in lines:
-                    label = int(line[0:2])
-                    name = filename[:filename.rfind('.')]
-                    image_name = glob.glob(f"{image_path}/{name}*")
-                    if image_name:
-                        image_name = image_name[0][image_name[0].rfind('/') + 1:]
-                        images_per_label[class_labels[label]].add(image_name)
+    for image_name, labels in tqdm.tqdm(index_dataset(image_path, annotation_path, cache).items(), 'splitting dataset'):
+        for label in np.unique(labels):
+            images_per_label[class_labels[label]].add(image_name)
     if save and target_path:
         for key, value in images_per_label.items():
-            __copy_file(source_path=image_path, target_path=f'{target_path}/{key}', files=list(value))
+            copy_file(source_path=image_path, target_path=f'{target_path}/{key}', files=list(value), mode=copy_mode)
     return images_per_label
 
 
-def dataset_summary(data_file, save=False):
+def dataset_summary(data_file, save=False, instances=False, cache=False):
     """
     This method returns a detailed summary of the data-set with the help of data.yaml file,
     also saves the summary to csv file if save is True
     Args:
         data_file: <string> path to data.yaml file
         save: <boolean> Saves summary to csv file if True.
+        instances: <boolean> Adds the number of objects per label and split to the summary if True.
+        cache: <boolean> Reuses parsed annotations of previous calls if True.
     """
     with open(data_file, 'r') as stream:
         data = yaml.safe_load(stream)
@@ -105,21 +153,22 @@ def dataset_summary(data_file, save=False):
         valid_path = directory + data['val'].replace('.', '')
         test_path = directory + data['test'].replace('.', '')
         train_path = directory + data['train'].replace('.', '')
-        valid_summary = split_dataset_by_labels(image_path=valid_path,
-                                                annotation_path=valid_path.replace('images', 'labels'),
-                                                class_labels=class_labels, save=False)
-        test_summary = split_dataset_by_labels(image_path=test_path,
-                                               annotation_path=test_path.replace('images', 'labels'),
-                                               class_labels=class_labels, save=False)
-        train_summary = split_dataset_by_labels(image_path=train_path,
-                                                annotation_path=train_path.replace('images', 'labels'),
-                                                class_labels=class_labels, save=False)
-        valid_images = {k: len(v) for k, v in valid_summary.items()}
-        test_images = {k: len(v) for k, v in test_summary.items()}
-        train_images = {k: len(v) for k, v in train_summary.items()}
+        summaries = {}
+        counts = {}
+        for split, path in [('train', train_path), ('test', test_path), ('valid', valid_path)]:
+            # splits which point to the same folder share one index
+            if path not in summaries:
+                summaries[path] = __count_labels(index_dataset(image_path=path,
+                                                               annotation_path=path.replace('images', 'labels'),
+                                                               cache=cache), len(class_labels))
+            counts[split] = summaries[path]
         header = ['No', "Label", 'Train', 'Test', 'Valid']
-        data = [[i + 1, label, train_images[label], test_images[label], valid_images[label]] for i, label in
+        data = [[i + 1, label, *[int(counts[split][0][i]) for split in ['train', 'test', 'valid']]] for i, label in
                 enumerate(class_labels)]
+        if instances:
+            header += ['Train Instances', 'Test Instances', 'Valid Instances']
+            for i, row in enumerate(data):
+                row += [int(counts[split][1][i]) for split in ['train', 'test', 'valid']]
         termtables.print(data, header, style=termtables.styles.rounded_thick)
         if save:
             my_df = pd.DataFrame(data)
@@ -0,0 +1,189 @@
+"""
+Opt-in instrumentation of mlutils operations: per stage timers, counters (items, bytes read and written, cache hits)
+and hooks receiving every event. Instrumentation is disabled by default, a disabled stage or counter costs a single
+flag check.
+
+    from mlutils import instrumentation
+
+    with instrumentation.profile():
+        augmentation.augment_images()
+    instrumentation.report()
+"""
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+__all__ = ['enable', 'disable', 'is_enabled', 'reset', 'profile', 'stage', 'timed', 'count', 'add_hook',
+           'remove_hook', 'summary', 'report']
+
+_enabled = False
+_lock = threading.Lock()
+_stages = {}
+_counters = {}
+_hooks = []
+_disabled_stage = contextlib.nullcontext()
+
+
+def enable():
+    """ Starts recording stages and counters """
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """ Stops recording stages and counters, the recorded values are kept until reset """
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """ Clears the recorded stages and counters """
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+@contextlib.contextmanager
+def profile(hook=None):
+    """
+    Records the stages and counters of the operations run in the block, from a clean state.
+    Parameters:
+        hook <function>: Receives every event of the block, see add_hook.
+    """
+    reset()
+    if hook:
+        add_hook(hook)
+    enable()
+    try:
+        yield
+    finally:
+        disable()
+        if hook:
+            remove_hook(hook)
+
+
+def add_hook(hook):
+    """
+    Parameters:
+        hook <function>: Called with every event, a dict of type ('stage' or 'count'), name, value (seconds of the
+                         stage or increment of the counter) and pid, in the thread and process of the operation.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def _emit(event_type, name, value):
+    event = {'type': event_type, 'name': name, 'value': value, 'pid': os.getpid()}
+    for hook in list(_hooks):
+        hook(event)
+
+
+@contextlib.contextmanager
+def _timed_stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        with _lock:
+            calls = _stages.setdefault(name, [0, 0.0])
+            calls[0] += 1
+            calls[1] += seconds
+        if _hooks:
+            _emit('stage', name, seconds)
+
+
+def stage(name):
+    """
+    Times the block as a call of the stage name.
+
+        with instrumentation.stage('augmentation.transform'):
+            ...
+    """
+    if not _enabled:
+        return _disabled_stage
+    return _timed_stage(name)
+
+
+def timed(name):
+    """
+    Decorator timing every call of the function as a call of the stage name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _timed_stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """
+    Adds value to the counter name.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    if _hooks:
+        _emit('count', name, value)
+
+
+def _collect():
+    # returns and clears the records of this process, merged by the parent of worker processes
+    with _lock:
+        records = {'stages': {name: tuple(x) for name, x in _stages.items()}, 'counters': dict(_counters)}
+        _stages.clear()
+        _counters.clear()
+    return records
+
+
+def _merge(records):
+    with _lock:
+        for name, (calls, seconds) in records['stages'].items():
+            totals = _stages.setdefault(name, [0, 0.0])
+            totals[0] += calls
+            totals[1] += seconds
+        for name, value in records['counters'].items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+def summary():
+    """
+    Returns:
+        <dict>: stages with the calls, total and mean seconds of every stage and counters with their values.
+    """
+    with _lock:
+        stages = {name: {'calls': calls, 'seconds': seconds, 'mean_seconds': seconds / calls}
+                  for name, (calls, seconds) in sorted(_stages.items())}
+        return {'stages': stages, 'counters': dict(sorted(_counters.items()))}
+
+
+def report(file=None):
+    """
+    Writes the summary as a table.
+    Parameters:
+        file: The output stream, stdout by default.
+    """
+    file = file or sys.stdout
+    result = summary()
+    width = max([len(name) for name in [*result['stages'], *result['counters']]] + [7])
+    print(f"{'Stage':<{width}} {'Calls':>10} {'Total s':>12} {'Mean ms':>12}", file=file)
+    for name, x in result['stages'].items():
+        print(f"{name:<{width}} {x['calls']:>10} {x['seconds']:>12.3f} {x['mean_seconds'] * 1000:>12.3f}", file=file)
+    print(f"{'Counter':<{width}} {'Value':>10}", file=file)
+    for name, value in result['counters'].items():
+        print(f'{name:<{width}} {value:>10}', file=file)
@@ -0,0 +1,31 @@
+import importlib
+import sys
+import types
+
+__all__ = ['LazyModule', 'lazy_import']
+
+
+class LazyModule(types.ModuleType):
+    """
+    Stands in for a module which is only imported on the first access to one of its attributes. The attributes of
+    the imported module are then copied to the proxy, so later accesses cost the same as on the module itself.
+    """
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+    def __repr__(self):
+        return f'<lazy module {self.__name__!r}>'
+
+
+def lazy_import(name):
+    """
+    Parameters:
+        name <str>: The absolute name of the module, e.g. 'scipy.optimize'.
+    Returns:
+        <LazyModule>: The module itself if it is already imported, otherwise a proxy importing it on first use.
+    """
+    module = sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
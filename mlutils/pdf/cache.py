@@ -0,0 +1,188 @@
+import hashlib
+import os
+import pickle
+import threading
+import zlib
+from collections import OrderedDict
+
+from mlutils import instrumentation
+
+__all__ = ['PDFCache', 'RenderCache', 'content_hash']
+
+
+def content_hash(content):
+    """
+    Parameters:
+        content <bytes>: The input document content.
+    Returns:
+        <str>: The hex digest identifying the content.
+    """
+    return hashlib.blake2b(content, digest_size=20).hexdigest()
+
+
+class PDFCache:
+    """
+    On-disk cache of PDF extraction results keyed by the hash of the document content.
+    Entries are compressed pickles, when the cache grows over max_size bytes the least recently used
+    entries are evicted. Hits, misses and evictions are counted on the instance.
+    """
+    __suffix = '.pdfcache'
+
+    def __init__(self, cache_dir, max_size=512 * 1024 ** 2):
+        """
+        Parameters:
+            cache_dir <str>: The directory where entries are stored.
+            max_size <int>: The maximum total size of the entries in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key + self.__suffix)
+
+    def __entries(self):
+        with os.scandir(self.cache_dir) as entries:
+            return [(entry.path, entry.stat()) for entry in entries if entry.name.endswith(self.__suffix)]
+
+    def get(self, key):
+        """
+        Parameters:
+            key <str>: The content hash of the document.
+        Returns:
+            The cached value, or None if the key is not cached.
+        """
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            value = pickle.loads(zlib.decompress(blob))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            instrumentation.count('pdf_cache.misses')
+            return None
+        # the modification time orders entries for the LRU eviction
+        os.utime(path)
+        self.hits += 1
+        instrumentation.count('pdf_cache.hits')
+        instrumentation.count('pdf_cache.bytes_read', len(blob))
+        return value
+
+    def put(self, key, value):
+        """
+        Parameters:
+            key <str>: The content hash of the document.
+            value: The picklable value to be cached.
+        """
+        path = self.__path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        blob = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        instrumentation.count('pdf_cache.bytes_written', len(blob))
+        self.__evict()
+
+    def __evict(self):
+        entries = self.__entries()
+        size = sum(stat.st_size for _, stat in entries)
+        for path, stat in sorted(entries, key=lambda x: x[1].st_mtime_ns):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= stat.st_size
+            self.evictions += 1
+            instrumentation.count('pdf_cache.evictions')
+
+    def clear(self):
+        """ Removes every entry of the cache """
+        for path, _ in self.__entries():
+            os.remove(path)
+
+    def stats(self):
+        """
+        Returns:
+            <dict>: The number of hits, misses and evictions.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+class RenderCache:
+    """
+    In-memory LRU cache of rendered pages keyed by (content hash, page number, dpi, clip, mode), it can be shared by
+    the PDFHelper instances of a process. When the rendered pages take more than max_size bytes the least recently
+    used ones are evicted. Hits, misses and evictions are counted on the instance.
+    """
+
+    def __init__(self, max_size=256 * 1024 ** 2):
+        """
+        Parameters:
+            max_size <int>: The maximum total size of the cached pages in bytes.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            <class 'numpy.ndarray'>: The cached page, or None if the key is not cached.
+        """
+        with self.__lock:
+            page = self.__entries.get(key)
+            if page is None:
+                self.misses += 1
+            else:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+        instrumentation.count('render_cache.misses' if page is None else 'render_cache.hits')
+        return page
+
+    def put(self, key, page):
+        """
+        Parameters:
+            key <tuple>: (content hash, page number, dpi, clip, mode) of the page.
+            page <class 'numpy.ndarray'>: The rendered page, pages larger than max_size are not cached.
+        """
+        if page.nbytes > self.max_size:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.nbytes
+            self.__entries[key] = page
+            self.size += page.nbytes
+            evictions = 0
+            while self.size > self.max_size:
+                _, evicted = self.__entries.popitem(last=False)
+                self.size -= evicted.nbytes
+                evictions += 1
+            self.evictions += evictions
+        if evictions:
+            instrumentation.count('render_cache.evictions', evictions)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        """ Removes every page of the cache """
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns:
+            <dict>: The number of hits, misses and evictions.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -1,25 +1,156 @@
 import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from itertools import chain
 
-import fitz
+import numpy as np
+
+from mlutils import instrumentation
+from mlutils.exceptions import InvalidConfiguration
+from mlutils.lazy import lazy_import
+from mlutils.pdf.cache import RenderCache, content_hash
+
+fitz = lazy_import('fitz')
+
+_color_orders = ('rgb', 'bgr')
+
+
+class _PixmapBuffer:
+    # exposes the samples of a pixmap to numpy without copy and keeps the pixmap alive as long as the array
+    def __init__(self, pixmap):
+        self.pixmap = pixmap
+        shape, strides = (pixmap.h, pixmap.w, pixmap.n), (pixmap.stride, pixmap.n, 1)
+        if pixmap.n == 1:
+            shape, strides = shape[:2], strides[:2]
+        self.__array_interface__ = {'shape': shape, 'typestr': '|u1', 'data': (pixmap.samples_ptr, False),
+                                    'strides': strides, 'version': 3}
+
+
+def _render_page(doc, page_no, dpi, clip, grayscale, color_order):
+    pixmap = doc[page_no].get_pixmap(dpi=dpi, clip=fitz.Rect(clip) if clip is not None else None,
+                                     colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False)
+    page = np.asarray(_PixmapBuffer(pixmap))
+    if color_order == 'bgr' and not grayscale:
+        page[..., [0, 2]] = page[..., [2, 0]]
+    # rendered pages are shared through the render cache
+    page.flags.writeable = False
+    return page
+
+
+def _render_pages(task):
+    source, pages, dpi, clip, grayscale, color_order = task
+    doc = fitz.open(source, filetype='pdf') if isinstance(source, str) else fitz.open(stream=source, filetype='pdf')
+    return [_render_page(doc, page_no, dpi, clip, grayscale, color_order) for page_no in pages]
 
 
 class PDFHelper:
     """ Contains helper method for commonly used PDF extraction operations"""
+    __cache_version = 1
 
-    def __init__(self, file):
+    def __init__(self, file, lazy=False, cache=None, render_cache=None):
+        """
+        Parameters:
+            file <str, bytes or io.IOBase>: The input PDF document path, content or stream.
+            lazy <bool>: If True, the text of a page is extracted on its first access instead of on construction.
+            cache <PDFCache>: If given, text spans and form fields are loaded from the cache when the same content
+                              was extracted before, otherwise they are extracted and stored in the cache.
+            render_cache <RenderCache>: The cache of rendered pages, which can be shared by many documents.
+                                        Defaults to a cache of 64 MiB owned by the instance.
+        """
+        self.content_hash = None
         if isinstance(file, io.IOBase):
+            file = file.read()
+        if cache is not None:
+            if isinstance(file, str):
+                with open(file, 'rb') as f:
+                    file = f.read()
+            self.content_hash = content_hash(file)
+        # the path or content is reopened by the worker processes rendering pages
+        self.__source = file
+        self.__render_cache = render_cache if render_cache is not None else RenderCache(64 * 1024 ** 2)
+        if isinstance(file, (bytes, bytearray)):
             self.doc = fitz.open(stream=file, filetype="pdf")
         elif isinstance(file, str):
             self.doc = fitz.open(file, filetype="pdf")
-        self.metadata = ()
-        for page in self.doc:
-            blocks = page.get_text('dict')['blocks']
-            page_text = tuple(
-                [(span['text'], span['bbox'], page.number) for block in blocks if not block['type'] for line in
-                 block['lines'] for span in line['spans']])
-            page_text = tuple(sorted(page_text, key=lambda x: x[1][1]))
-            self.metadata = self.metadata + page_text
-        self.converted_doc = fitz.open('pdf', self.doc.convert_to_pdf(from_page=0, to_page=self.doc.page_count))
+        self.__pages = [None] * self.doc.page_count
+        self.__metadata = None
+        self.__converted_doc = None
+        self.__text_index = None
+        self.__page_index = None
+        self.__page_text_indexes = {}
+        self.__form_fields = None
+        if cache is not None:
+            self.__load_cache(cache)
+        elif not lazy:
+            for page_no in range(self.doc.page_count):
+                self._get_page_text(page_no)
+
+    @property
+    def metadata(self):
+        """ (text, bbox, page number) of every text span of the document, sorted by position on each page """
+        if self.__metadata is None:
+            self.__metadata = tuple(chain.from_iterable(self._get_page_text(page_no)
+                                                        for page_no in range(self.doc.page_count)))
+        return self.__metadata
+
+    @property
+    def converted_doc(self):
+        if self.__converted_doc is None:
+            self.__converted_doc = fitz.open('pdf', self.doc.convert_to_pdf(from_page=0,
+                                                                             to_page=self.doc.page_count))
+        return self.__converted_doc
+
+    def __load_cache(self, cache):
+        key = f'{self.content_hash}.v{self.__cache_version}'
+        entry = cache.get(key)
+        if entry is not None:
+            self.__pages = list(entry['pages'])
+            self.__form_fields = entry['form_fields']
+            return
+        pages = range(self.doc.page_count)
+        for page_no in pages:
+            self._get_page_text(page_no)
+        self.__form_fields = [self.__extract_form_fields(page_no) for page_no in pages]
+        cache.put(key, {'pages': self.__pages, 'form_fields': self.__form_fields})
+
+    def _get_page_text(self, page_no):
+        if not 0 <= page_no < self.doc.page_count:
+            return ()
+        if self.__pages[page_no] is None:
+            with instrumentation.stage('pdf.page_text'):
+                page = self.doc[page_no]
+                blocks = page.get_text('dict')['blocks']
+                page_text = [(span['text'], span['bbox'], page.number) for block in blocks if not block['type']
+                             for line in block['lines'] for span in line['spans']]
+                self.__pages[page_no] = tuple(sorted(page_text, key=lambda x: x[1][1]))
+            instrumentation.count('pdf.pages')
+        return self.__pages[page_no]
+
+    def __index_spans(self, spans):
+        text_index = {}
+        for text, bbox, page_no in spans:
+            text_index.setdefault(text.strip(), []).append((bbox, page_no))
+        return {text: tuple(entries) for text, entries in text_index.items()}
+
+    def __get_text_index(self, page_no=None):
+        # stripped span text -> ((bbox, page number), ...), for the whole document or a single page
+        if page_no is not None:
+            if page_no not in self.__page_text_indexes:
+                self.__page_text_indexes[page_no] = self.__index_spans(self._get_page_text(page_no))
+            return self.__page_text_indexes[page_no]
+        if self.__text_index is None:
+            self.__text_index = self.__index_spans(self.metadata)
+        return self.__text_index
+
+    def __get_page_index(self):
+        # span text -> sorted page numbers where the span is found
+        if self.__page_index is None:
+            page_index = {}
+            for text, _, page_no in self.metadata:
+                page_index.setdefault(text, set()).add(page_no)
+            self.__page_index = {text: sorted(pages) for text, pages in page_index.items()}
+        return self.__page_index
 
     def get_images_by_page(self, page_no):
         """
@@ -39,8 +170,18 @@ class PDFHelper:
         Returns:
             <list>: The list of page number(s) where the input text is found
         """
-        output = list(filter(lambda x: text in x, self.metadata))
-        return list(set([x[-1] for x in output])) if output else None
+        pages = self.__get_page_index().get(text)
+        return list(pages) if pages else None
+
+    def find_pages_by_texts(self, texts):
+        """
+        finds page numbers for a batch of input texts
+        Parameters:
+            texts <list>: The input texts to be found.
+        Returns:
+            <dict>: The input text as key and the list of page number(s) where it is found, or None, as value
+        """
+        return {text: self.find_page_by_text(text) for text in texts}
 
     def get_bbox_by_text(self, text, page_no=None):
         """
@@ -53,11 +194,18 @@ class PDFHelper:
             Return:
                 <tuple> : The output bounding box and page number where text is found.
         """
-        bbox = tuple(filter(lambda x: text == x[0].strip() and page_no == x[2],
-                            self.metadata)) if page_no is not None else tuple(
-            filter(lambda x: text == x[0].strip(), self.metadata))
-        bbox = tuple(x[1:] for x in bbox)
-        return bbox
+        return self.__get_text_index(page_no).get(text, ())
+
+    def get_bboxes_by_texts(self, texts, page_no=None):
+        """
+            Return Bounding Box and Page Number for a batch of input texts.
+            Parameters:
+                texts <list> : The input texts to be found.
+                page_no <int> : The input page_no of document.
+            Return:
+                <dict> : The input text as key and the output of get_bbox_by_text as value.
+        """
+        return {text: self.get_bbox_by_text(text, page_no) for text in texts}
 
     def get_attributes_by_page(self, page_no):
         """
@@ -67,8 +215,7 @@ class PDFHelper:
             Return:
                 <tuple> : The output text, bounding box and page number where page_no is found.
         """
-        data = tuple(filter(lambda x: x[2] == page_no, self.metadata))
-        return data
+        return self._get_page_text(page_no)
 
     def get_form_fields_by_page(self, page_no):
         """
@@ -80,5 +227,145 @@ class PDFHelper:
                 fields <dict>: PDF Form field name and value for the given page no, as dictionary of field name
                 as key and field value is dictionary value. {field_name: field_value}
         """
+        if self.__form_fields is not None:
+            return self.__form_fields[page_no]
+        return self.__extract_form_fields(page_no)
+
+    def __extract_form_fields(self, page_no):
         fields = {field.field_name: field.field_value for field in self.doc[page_no].widgets()}
         return fields if fields else None
+
+    def __render_key(self, page_no, dpi, clip, grayscale, color_order):
+        if color_order not in _color_orders:
+            raise InvalidConfiguration(f'"color_order" must be one of {_color_orders}')
+        if self.content_hash is None:
+            if isinstance(self.__source, str):
+                with open(self.__source, 'rb') as f:
+                    self.content_hash = content_hash(f.read())
+            else:
+                self.content_hash = content_hash(self.__source)
+        clip = tuple(float(x) for x in clip) if clip is not None else None
+        return self.content_hash, page_no, dpi, clip, 'gray' if grayscale else color_order
+
+    def render_page(self, page_no, dpi=150, clip=None, grayscale=False, color_order='rgb'):
+        """
+            Renders a page to an image, the array is a read-only view of the rendered pixmap (copy it to modify it).
+            Rendered pages are kept in the render cache.
+            Parameters:
+                page_no <int> : The input page_no of document.
+                dpi <int> : The resolution of the image.
+                clip <tuple> : (x0, y0, x1, y1) in PDF points, e.g. a bounding box of get_bbox_by_text, only this
+                               region of the page is rendered.
+                grayscale <bool> : If True, renders a single channel (height, width) image.
+                color_order <str> : 'rgb' or 'bgr' (the order of OpenCV), the channel order of colour images.
+            Return:
+                <class 'numpy.ndarray'> : The (height, width, 3) uint8 image of the page.
+        """
+        key = self.__render_key(page_no, dpi, clip, grayscale, color_order)
+        page = self.__render_cache.get(key)
+        if page is None:
+            with instrumentation.stage('pdf.render_page'):
+                page = _render_page(self.doc, page_no, dpi, clip, grayscale, color_order)
+            instrumentation.count('pdf.rendered_pages')
+            self.__render_cache.put(key, page)
+        return page
+
+    def render_pages(self, pages=None, dpi=150, clip=None, grayscale=False, color_order='rgb', workers=None):
+        """
+            Renders many pages, see render_page for the parameters. With workers, the pages missing from the render
+            cache are split into contiguous ranges which are rendered by a pool of worker processes, every worker
+            opens the document again, which only pays off for many pages.
+            Parameters:
+                pages <list> : The page numbers, all pages of the document by default.
+                workers <int> : The number of worker processes, pages are rendered in the calling process unless
+                                it is above 1.
+            Return:
+                <list> : The image of every page.
+        """
+        pages = list(range(self.doc.page_count) if pages is None else pages)
+        keys = [self.__render_key(page_no, dpi, clip, grayscale, color_order) for page_no in pages]
+        rendered = {key: self.__render_cache.get(key) for key in set(keys)}
+        missing = sorted(key[1] for key, page in rendered.items() if page is None)
+        workers = min(workers or 1, len(missing))
+        if workers > 1:
+            with instrumentation.stage('pdf.render_pages'):
+                tasks = [(self.__source, chunk.tolist(), dpi, clip, grayscale, color_order)
+                         for chunk in np.array_split(missing, workers)]
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = chain.from_iterable(executor.map(_render_pages, tasks))
+                    for page_no, page in zip(missing, results):
+                        page.flags.writeable = False
+                        key = self.__render_key(page_no, dpi, clip, grayscale, color_order)
+                        rendered[key] = page
+                        self.__render_cache.put(key, page)
+            instrumentation.count('pdf.rendered_pages', len(missing))
+        else:
+            for page_no in missing:
+                key = self.__render_key(page_no, dpi, clip, grayscale, color_order)
+                rendered[key] = self.render_page(page_no, dpi, clip, grayscale, color_order)
+        return [rendered[key] for key in keys]
+
+
+def _extract_document(task):
+    index, source, file, images, form_fields = task
+    start = time.perf_counter()
+    result = {'index': index, 'source': source, 'page_count': 0, 'spans': (), 'form_fields': None, 'images': None,
+              'error': None}
+    try:
+        pdf = PDFHelper(file)
+        pages = range(pdf.doc.page_count)
+        result['page_count'] = pdf.doc.page_count
+        result['spans'] = tuple(pdf.get_attributes_by_page(page_no) for page_no in pages)
+        if form_fields:
+            result['form_fields'] = [pdf.get_form_fields_by_page(page_no) for page_no in pages]
+        if images:
+            result['images'] = [pdf.get_images_by_page(page_no) for page_no in pages]
+    except Exception as e:
+        result['error'] = f'{e.__class__.__name__}: {e}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def iter_extract_documents(files, workers=None, max_pending=None, images=True, form_fields=True):
+    """
+    Extracts text spans, form fields and image listings of many PDF documents in a process pool and yields the
+    result of every document as soon as it is completed. A failing document does not stop the batch, its error
+    is reported in the result instead.
+    Parameters:
+        files <list>: The input PDF document paths, contents or streams.
+        workers <int>: The number of worker processes, defaults to the number of CPUs.
+        max_pending <int>: The maximum number of documents submitted to the pool at a time, bounds the memory
+                           used by streams read ahead of the workers. Defaults to twice the number of workers.
+        images <bool>: If True, lists the images of every page.
+        form_fields <bool>: If True, extracts the form fields of every page.
+    Yields:
+        <dict>: index of the document in files, source (path or None), page_count, spans (get_attributes_by_page
+                of every page), form_fields and images (one entry per page, or None if not extracted),
+                error (None on success) and seconds spent on the document.
+    """
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for index, file in enumerate(files):
+            if isinstance(file, io.IOBase):
+                source, file = None, file.read()
+            else:
+                source = file if isinstance(file, str) else None
+            pending.add(executor.submit(_extract_document, (index, source, file, images, form_fields)))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def extract_documents(files, workers=None, max_pending=None, images=True, form_fields=True):
+    """
+    Extracts many PDF documents in a process pool, see iter_extract_documents.
+    Returns:
+        <list>: The result of every document, in the order of files.
+    """
+    results = iter_extract_documents(files, workers, max_pending, images, form_fields)
+    return sorted(results, key=lambda x: x['index'])
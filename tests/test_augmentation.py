@@ -0,0 +1,143 @@
+import os
+import shutil
+
+import albumentations as A
+import cv2
+import numpy as np
+import pytest
+
+from mlutils.data.augmentation import Augmentation, AugmentedDataset
+from mlutils.data.shards import ShardReader
+from mlutils.exceptions import InvalidConfiguration
+
+source_path = './data/augmentation/dataset'
+label_path = './data/augmentation/labels'
+target_path = './data/augmentation_target'
+
+transform = A.Compose([
+    A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=1),
+    A.HorizontalFlip()], bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
+
+
+def _config(**kwargs):
+    return {'transform': transform, 'multiplier': 2, 'source_path': source_path, 'label_path': label_path,
+            'target_path': target_path} | kwargs
+
+
+class TestAugmentation:
+    def teardown_method(self):
+        if os.path.exists(target_path):
+            shutil.rmtree(target_path)
+
+    def test_augment_images_serial(self):
+        summary = Augmentation(_config()).augment_images()
+        assert summary['images'] == 3
+        assert len(os.listdir(os.path.join(target_path, 'images'))) == 6
+        assert len(os.listdir(os.path.join(target_path, 'labels'))) == 6
+
+    def test_augment_images_parallel(self):
+        summary = Augmentation(_config(workers=2, chunk_size=1)).augment_images()
+        assert summary['samples'] == 6
+        assert len(os.listdir(os.path.join(target_path, 'images'))) == 6
+
+    def test_augment_images_resume(self):
+        Augmentation(_config()).augment_images()
+        # without resume a second run augments every image again
+        assert Augmentation(_config()).augment_images()['images'] == 3
+        summary = Augmentation(_config(resume=True)).augment_images()
+        assert summary['images'] == 0
+        assert len(os.listdir(os.path.join(target_path, 'images'))) == 6
+
+    def test_augment_images_seed(self):
+        Augmentation(_config(seed=7)).augment_images()
+        labels = os.path.join(target_path, 'labels')
+        first = {name: open(os.path.join(labels, name)).read() for name in os.listdir(labels)}
+        shutil.rmtree(target_path)
+        Augmentation(_config(seed=7, workers=2)).augment_images()
+        second = {name: open(os.path.join(labels, name)).read() for name in os.listdir(labels)}
+        assert first == second
+
+    def test_invalid_workers(self):
+        with pytest.raises(InvalidConfiguration):
+            Augmentation(_config(workers=0))
+
+    def test_iter_augmented(self):
+        config = _config()
+        del config['target_path']
+        samples = list(Augmentation(config).iter_augmented())
+        assert len(samples) == 6
+        image, bboxes, class_labels = samples[0]
+        assert image.ndim == 3
+        assert len(bboxes) == len(class_labels)
+        assert not os.path.exists(target_path)
+
+    def test_augmented_dataset_prefetch(self):
+        dataset = AugmentedDataset(Augmentation(_config()), workers=2, prefetch=2)
+        assert len(list(dataset)) == 6
+        for sample in dataset:
+            break
+
+    def test_augment_images_without_target(self):
+        config = _config()
+        del config['target_path']
+        with pytest.raises(InvalidConfiguration):
+            Augmentation(config).augment_images()
+
+    def test_augment_images_shards(self):
+        Augmentation(_config(target_format='shards', workers=2, chunk_size=1)).augment_images()
+        reader = ShardReader(os.path.join(target_path, 'shards'))
+        assert len(reader) == 6
+        for key, data, labels in reader:
+            assert key.endswith('.jpg') and labels.shape[1] == 5
+            assert reader.read_image(key) is not None
+        assert not os.path.exists(os.path.join(target_path, 'images'))
+
+    def test_invalid_target_format(self):
+        with pytest.raises(InvalidConfiguration):
+            Augmentation(_config(target_format='tar'))
+
+    def test_pre_transform(self):
+        bbox_params = A.BboxParams(format='yolo', label_fields=['class_labels'])
+        config = _config(pre_transform=A.Compose([A.Resize(64, 96)], bbox_params=bbox_params))
+        del config['target_path']
+        samples = list(Augmentation(config).iter_augmented())
+        assert len(samples) == 6
+        assert all(image.shape == (64, 96, 3) for image, _, _ in samples)
+
+    def test_color_order(self):
+        identity = A.Compose([A.NoOp()])
+        images = {}
+        for color_order in ['rgb', 'bgr']:
+            config = _config(transform=identity, multiplier=1, color_order=color_order)
+            del config['label_path']
+            del config['target_path']
+            images[color_order] = next(Augmentation(config).iter_augmented())[0]
+        assert np.array_equal(images['rgb'], images['bgr'][..., ::-1])
+        with pytest.raises(InvalidConfiguration):
+            Augmentation(_config(color_order='hsv'))
+
+    def test_color_order_saved_images(self):
+        identity = A.Compose([A.NoOp()])
+        saved = {}
+        for color_order in ['rgb', 'bgr']:
+            Augmentation(_config(transform=identity, multiplier=1, color_order=color_order, seed=0)).augment_images()
+            images = os.path.join(target_path, 'images')
+            saved[color_order] = [cv2.imread(os.path.join(images, name)) for name in sorted(os.listdir(images))]
+            shutil.rmtree(target_path)
+        assert all(np.array_equal(a, b) for a, b in zip(saved['rgb'], saved['bgr']))
+
+    def test_writer_threads(self):
+        identity = A.Compose([A.NoOp()])
+        saved = {}
+        for image_format, writer_threads in [('png', 0), ('npy', 2)]:
+            Augmentation(_config(transform=identity, multiplier=1, image_format=image_format,
+                                 writer_threads=writer_threads, workers=2, chunk_size=1)).augment_images()
+            images = os.path.join(target_path, 'images')
+            names = sorted(os.listdir(images))
+            assert all(name.endswith('.' + image_format) for name in names)
+            saved[image_format] = [cv2.imread(os.path.join(images, name)) if image_format == 'png' else
+                                   np.load(os.path.join(images, name)) for name in names]
+            shutil.rmtree(target_path)
+        assert all(np.array_equal(a, b) for a, b in zip(saved['png'], saved['npy']))
+        with pytest.raises(InvalidConfiguration):
+            Augmentation(_config(image_format='bmp'))
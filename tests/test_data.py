@@ -1,9 +1,15 @@
 import os
 import shutil
+import cv2
 import numpy as np
+import pytest
 
-from mlutils.exceptions import InvalidSplittingValues, InsufficientData, DirectoryNotFound
+from mlutils.exceptions import InvalidSplittingValues, InsufficientData, DirectoryNotFound, InvalidConfiguration
 from mlutils.data import split_data, split_dataset_from_dir
+from mlutils.data.splitting import split_indices, get_yolo_strata, split_dataset_by_hash
+from mlutils.data.labels import parse_labels, read_label, read_label_dir, format_labels, write_label
+from mlutils.data.shards import ShardWriter, ShardReader
+from mlutils.data.dedup import BKTree, find_duplicates, deduplicate_dir
 
 target_20 = './data/target_20'
 source_20 = './data/source_20'
@@ -106,3 +112,228 @@ class TestDataSplitDataset():
                                    train=0.7, valid=0.2, unseen_test=0.1)
         except DirectoryNotFound as e:
             assert True
+
+
+class TestLabels:
+    label_path = './data/yolov5_dataset/train/labels'
+    labels_target = './data/labels_target'
+
+    def test_read_label(self):
+        bboxes, class_labels = read_label(os.path.join(self.label_path, '1.txt'))
+        assert class_labels.tolist() == [1, 2]
+        assert bboxes.shape == (2, 4)
+        assert bboxes[0].tolist() == [0.436379, 0.370739, 0.242528, 0.161932]
+
+    def test_format_labels(self):
+        text = format_labels([0, 3], [[0.5, 0.5, 0.25, 0.25], [0.1, 0.2, 0.3, 0.4]])
+        assert text == '0 0.500000 0.500000 0.250000 0.250000 \n3 0.100000 0.200000 0.300000 0.400000 \n'
+        assert parse_labels(text)[:, 0].tolist() == [0, 3]
+        assert format_labels([], []) == ''
+
+    def test_parse_labels_extra_columns(self):
+        labels = parse_labels('1 0.1 0.2 0.3 0.4 0.5 0.6\n2 0.1 0.2 0.3 0.4\n')
+        assert labels.shape == (2, 5)
+
+    def test_parse_labels_malformed_row(self):
+        # the short and the long row have 10 values in total, they must not be reshaped into 2 rows
+        with pytest.raises(ValueError):
+            parse_labels('0 0.1 0.2 0.3\n1 0.1 0.2 0.3 0.4 0.5\n')
+        os.makedirs(self.labels_target)
+        try:
+            with open(os.path.join(self.labels_target, '1.txt'), 'w') as f:
+                f.write('0 0.1 0.2 0.3\n1 0.1 0.2 0.3 0.4 0.5\n')
+            with pytest.raises(ValueError):
+                read_label_dir(self.labels_target, cache=True)
+            assert not os.path.exists(self.labels_target + '.cache.npz')
+        finally:
+            shutil.rmtree(self.labels_target)
+
+    def test_read_label_dir_cache(self):
+        shutil.copytree(self.label_path, self.labels_target)
+        try:
+            labels = read_label_dir(self.labels_target, cache=True)
+            assert sorted(labels) == ['1.txt', '2.txt', '3.txt']
+            assert os.path.exists(self.labels_target + '.cache.npz')
+            write_label(os.path.join(self.labels_target, '4.txt'), [0], [[0.5, 0.5, 0.1, 0.1]])
+            cached = read_label_dir(self.labels_target, cache=True)
+            assert sorted(cached) == ['1.txt', '2.txt', '3.txt', '4.txt']
+            assert all(np.array_equal(labels[name], cached[name]) for name in labels)
+        finally:
+            shutil.rmtree(self.labels_target)
+            os.remove(self.labels_target + '.cache.npz')
+
+
+class TestSplitIndices:
+    def test_split_data_does_not_shuffle_input(self):
+        data = list(range(10))
+        dataset = split_data(data, train=0.7, valid=0.3, seed=1)
+        assert data == list(range(10))
+        assert isinstance(dataset.train, np.ndarray) and isinstance(dataset.valid, np.ndarray)
+        assert sorted(np.concatenate([dataset.train, dataset.valid]).tolist()) == data
+
+    def test_split_indices_seed(self):
+        first = split_indices(100, train=0.7, valid=0.2, unseen_test=0.1, seed=3)
+        second = split_indices(100, train=0.7, valid=0.2, unseen_test=0.1, seed=3)
+        assert all(np.array_equal(first[k], second[k]) for k in first)
+        assert sorted(np.concatenate(list(first.values())).tolist()) == list(range(100))
+
+    def test_split_indices_stratify(self):
+        labels = np.array([0] * 90 + [1] * 10)
+        indices = split_indices(100, train=0.7, valid=0.2, unseen_test=0.1, seed=0, stratify=labels)
+        assert [len(indices[k]) for k in ['train', 'valid', 'unseen_test']] == [70, 20, 10]
+        assert [int(labels[indices[k]].sum()) for k in ['train', 'valid', 'unseen_test']] == [7, 2, 1]
+
+    def test_split_indices_groups(self):
+        groups = np.repeat(np.arange(20), 5)
+        indices = split_indices(100, train=0.7, valid=0.3, seed=0, groups=groups)
+        assert len(indices['train']) == 70 and len(indices['valid']) == 30
+        assert not set(groups[indices['train']]) & set(groups[indices['valid']])
+        # both split points snap to the boundary of the two groups, the valid split would be empty
+        with pytest.raises(InsufficientData):
+            split_indices(10, train=0.5, valid=0.1, unseen_test=0.4, groups=[0] * 5 + [1] * 5)
+
+    def test_get_yolo_strata(self):
+        strata = get_yolo_strata(['1.jpeg', '2.jpeg', '3.jpeg', '4.jpeg'], './data/yolov5_dataset/train/labels')
+        assert strata.tolist() == [1, 3, 0, -1]
+
+
+class TestSplitDatasetByHash:
+    source_path = './data/hash_source'
+    target_path = './data/hash_target'
+
+    def teardown_method(self):
+        for path in [self.source_path, self.target_path]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def __listing(self):
+        return {split: sorted(os.listdir(os.path.join(self.target_path, split)))
+                for split in os.listdir(self.target_path) if not split.startswith('.')}
+
+    def test_split_dataset_by_hash_incremental(self):
+        shutil.copytree(source_20, self.source_path)
+        summary = split_dataset_by_hash(self.source_path, self.target_path, train=0.6, valid=0.2, unseen_test=0.2)
+        assert summary['added'] == 10
+        first = self.__listing()
+        assert sum(len(files) for files in first.values()) == 10
+
+        shutil.copy(os.path.join(self.source_path, '1.jpg'), os.path.join(self.source_path, '11.jpg'))
+        os.remove(os.path.join(self.source_path, '2.jpg'))
+        summary = split_dataset_by_hash(self.source_path, self.target_path, train=0.6, valid=0.2, unseen_test=0.2)
+        assert summary == {'added': 1, 'updated': 0, 'moved': 0, 'removed': 1, 'unchanged': 9}
+        second = self.__listing()
+        for split, files in first.items():
+            assert set(files) - {'2.jpg'} <= set(second[split])
+        assert sum(len(files) for files in second.values()) == 10
+
+    def test_split_dataset_by_hash_content(self):
+        shutil.copytree(source_20, self.source_path)
+        split_dataset_by_hash(self.source_path, self.target_path, hash_by='content')
+        listing = self.__listing()
+        # identical images land in the same dataset
+        assert ('1.jpg' in listing.get('train', [])) == ('2.jpg' in listing.get('train', []))
+
+    def test_split_dataset_by_hash_invalid_hash_by(self):
+        shutil.copytree(source_20, self.source_path)
+        with pytest.raises(InvalidConfiguration):
+            split_dataset_by_hash(self.source_path, self.target_path, hash_by='contents')
+        assert not os.path.exists(self.target_path)
+
+
+class TestShards:
+    shard_path = './data/shards_target'
+    source_path = './data/augmentation/dataset'
+    label_path = './data/augmentation/labels'
+
+    def teardown_method(self):
+        if os.path.exists(self.shard_path):
+            shutil.rmtree(self.shard_path)
+
+    def test_write_read(self):
+        labels = np.array([[1, 0.5, 0.5, 0.2, 0.2], [3, 0.1, 0.2, 0.3, 0.4]])
+        with ShardWriter(self.shard_path, max_shard_size=64) as writer:
+            for i in range(5):
+                writer.write(f'image_{i}.jpg', bytes([i]) * 100, labels[:i % 3])
+        assert len([x for x in os.listdir(self.shard_path) if x.endswith('.bin')]) == 5
+        reader = ShardReader(self.shard_path)
+        assert len(reader) == 5 and 'image_3.jpg' in reader and 'image_5.jpg' not in reader
+        data, image_labels = reader['image_4.jpg']
+        assert data.tobytes() == bytes([4]) * 100
+        assert np.array_equal(image_labels, labels[:1])
+        assert reader['image_3.jpg'][1].shape == (0, 5)
+        assert [key for key, _, _ in reader] == reader.keys() == [f'image_{i}.jpg' for i in range(5)]
+
+    def test_append_and_recover(self):
+        with ShardWriter(self.shard_path) as writer:
+            writer.write('a', b'first')
+            writer.write('b', b'b')
+        writer = ShardWriter(self.shard_path)
+        writer.write('a', b'second')
+        writer.write('c', b'c')
+        writer.flush()
+        # the writer is not closed, the index is rebuilt from the shards
+        reader = ShardReader(self.shard_path)
+        assert reader.keys() == ['a', 'b', 'c']
+        assert reader['a'][0].tobytes() == b'second'
+        writer.close()
+        assert ShardReader(self.shard_path)['b'][0].tobytes() == b'b'
+
+    def test_split_dataset_from_dir_shards(self):
+        split_dataset_from_dir(self.source_path, self.shard_path, train=0.6, valid=0.0, unseen_test=0.4, seed=0,
+                               label_path=self.label_path, target_format='shards')
+        train, test = ShardReader(os.path.join(self.shard_path, 'train')), \
+            ShardReader(os.path.join(self.shard_path, 'test'))
+        assert sorted(train.keys() + test.keys()) == sorted(os.listdir(self.source_path))
+        key = test.keys()[0]
+        with open(os.path.join(self.source_path, key), 'rb') as f:
+            assert test[key][0].tobytes() == f.read()
+        assert np.array_equal(test[key][1], read_label_dir(self.label_path)[os.path.splitext(key)[0] + '.txt'])
+        assert test.read_image(key).ndim == 3
+
+
+class TestDedup:
+    source_path = './data/dedup_source'
+    target_path = './data/dedup_target'
+
+    def setup_method(self):
+        os.makedirs(self.source_path)
+        for file in ['1.jpg', '3.jpg', '5.jpg', '7.jpg']:
+            shutil.copy(os.path.join(source_20, file), self.source_path)
+        # an exact copy and a resized, re-encoded copy of 1.jpg
+        shutil.copy(os.path.join(source_20, '1.jpg'), os.path.join(self.source_path, '1_copy.jpg'))
+        image = cv2.imread(os.path.join(source_20, '1.jpg'))
+        cv2.imwrite(os.path.join(self.source_path, '1_small.png'), cv2.resize(image, None, fx=0.5, fy=0.5))
+
+    def teardown_method(self):
+        for path in [self.source_path, self.target_path, target_20]:
+            if os.path.exists(path):
+                shutil.rmtree(path)
+
+    def test_bk_tree(self):
+        values = np.random.default_rng(0).integers(0, 2 ** 63, 200).tolist()
+        tree = BKTree((value, i) for i, value in enumerate(values))
+        for radius in [0, 8, 30]:
+            expected = sorted(i for i, value in enumerate(values) if bin(value ^ values[0]).count('1') <= radius)
+            assert sorted(i for _, i in tree.search(values[0], radius)) == expected
+
+    def test_find_duplicates(self):
+        index_path = os.path.join(self.source_path, '.index.json')
+        paths = [os.path.join(self.source_path, file) for file in os.listdir(self.source_path)]
+        clusters = find_duplicates(paths, index_path=index_path)
+        assert [[os.path.basename(path) for path in cluster] for cluster in clusters] == \
+               [['1.jpg', '1_copy.jpg', '1_small.png']]
+        assert find_duplicates(paths, index_path=index_path) == clusters
+        exact = find_duplicates(paths, radius=None)
+        assert [[os.path.basename(path) for path in cluster] for cluster in exact] == [['1.jpg', '1_copy.jpg']]
+
+    def test_deduplicate_dir(self):
+        deduplicate_dir(self.source_path, self.target_path)
+        assert sorted(os.listdir(self.target_path)) == ['1.jpg', '3.jpg', '5.jpg', '7.jpg']
+
+    def test_split_dataset_from_dir_dedup(self):
+        split_dataset_from_dir(self.source_path, target_20, train=0.5, unseen_test=0.5, seed=0, dedup='group')
+        splits = [set(os.listdir(os.path.join(target_20, split))) for split in ['train', 'test']]
+        assert any({'1.jpg', '1_copy.jpg', '1_small.png'} <= files for files in splits)
+        shutil.rmtree(target_20)
+        split_dataset_from_dir(self.source_path, target_20, train=0.5, unseen_test=0.5, seed=0, dedup='filter')
+        assert sum(len(os.listdir(os.path.join(target_20, split))) for split in ['train', 'test']) == 4
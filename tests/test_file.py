@@ -0,0 +1,48 @@
+import os
+import shutil
+
+import pytest
+
+from mlutils.file.utils import copy_file, transfer_files
+
+source_20 = './data/source_20'
+target_path = './data/transfer_target'
+
+
+class TestTransferFiles:
+    def teardown_method(self):
+        if os.path.exists(target_path):
+            shutil.rmtree(target_path)
+
+    def test_copy_file(self):
+        plan = copy_file(source_20, target_path, files=['1.jpg', '2.jpg'])
+        assert [action for _, _, action in plan] == ['copy', 'copy']
+        assert sorted(os.listdir(target_path)) == ['1.jpg', '2.jpg']
+
+    def test_skip_identical(self):
+        copy_file(source_20, target_path)
+        plan = copy_file(source_20, target_path)
+        assert len(plan) == 10
+        assert all(action == 'skip' for _, _, action in plan)
+
+    def test_dry_run(self):
+        plan = transfer_files(source_20, target_path, dry_run=True)
+        assert len(plan) == 10
+        assert not os.path.exists(target_path)
+
+    def test_link_modes(self):
+        source, target = os.path.join(source_20, '1.jpg'), os.path.join(target_path, '1.jpg')
+        for mode in ['hardlink', 'symlink', 'reflink']:
+            transfer_files(source_20, target_path, files=['1.jpg'], mode=mode, skip_identical=False)
+            with open(target, 'rb') as f, open(source, 'rb') as s:
+                assert f.read() == s.read()
+            if mode == 'hardlink':
+                assert not os.path.islink(target) and os.stat(target).st_ino == os.stat(source).st_ino
+            elif mode == 'symlink':
+                assert os.path.islink(target) and os.path.samefile(target, source)
+            else:
+                assert not os.path.islink(target)
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError):
+            transfer_files(source_20, target_path, mode='move')
@@ -1,10 +1,18 @@
+import json
 import os
 import shutil
 
+import cv2
 import fitz
+import numpy as np
+import pytest
 
 from mlutils.data.filter import filter_images_by_dimension
-from mlutils.image.cv_helper import apply_bbox_padding
+from mlutils.image.utils import get_image_size
+from mlutils.image.writer import ImageWriter, decode_image, encode_image
+from mlutils.image.cv_helper import (apply_bbox_padding, apply_bbox_paddings, get_object, get_objects, calculate_iou,
+                                     calculate_iou_matrix, match_boxes, non_max_suppression, estimate_skew_angle,
+                                     fix_skew, get_skew_angel, match_template, TemplateBank)
 
 target_20 = './data/target_20'
 source_20 = './data/source_20'
@@ -32,3 +40,138 @@ class TestDataSplitDataset():
                                x0_pad=x0, y0_pad=y0, x1_pad=x1, y1_pad=y1)
         result = (6.37, 8.42, 6.62, 8.67)
         assert x == result
+
+    def test_calculate_iou_matrix(self):
+        boxes_a = [(0, 0, 10, 10), (5, 5, 15, 15)]
+        boxes_b = [(0, 0, 10, 10), (20, 20, 30, 30), (5, 5, 15, 15)]
+        iou = calculate_iou_matrix(boxes_a, boxes_b)
+        assert iou.shape == (2, 3)
+        for i, a in enumerate(boxes_a):
+            for j, b in enumerate(boxes_b):
+                assert np.isclose(iou[i, j], calculate_iou(a, b))
+        assert np.isclose(calculate_iou_matrix(boxes_a[:1], boxes_a[1:], pixel_offset=0)[0, 0], 25 / 175)
+
+    def test_non_max_suppression(self):
+        boxes = [(0, 0, 10, 10), (1, 1, 10, 10), (20, 20, 30, 30), (0, 0, 10, 10)]
+        scores = [0.8, 0.9, 0.7, 0.6]
+        assert non_max_suppression(boxes, scores).tolist() == [1, 2]
+        assert non_max_suppression(boxes, scores, class_ids=[0, 0, 0, 1]).tolist() == [1, 2, 3]
+
+    def test_match_boxes(self):
+        predictions = [(0, 0, 10, 10), (1, 0, 11, 10), (50, 50, 60, 60)]
+        ground_truths = [(0, 0, 10, 10), (2, 0, 12, 10)]
+        greedy = match_boxes(predictions, ground_truths)
+        assert greedy['matches'].tolist() == [[0, 0], [1, 1]]
+        assert greedy['unmatched_predictions'].tolist() == [2]
+        assert greedy['unmatched_ground_truths'].tolist() == []
+        hungarian = match_boxes(predictions, ground_truths, method='hungarian')
+        assert hungarian['matches'].tolist() == [[0, 0], [1, 1]]
+        # the crossed pairs have a higher total IoU (0.46 + 0.64) but 0.46 is below the threshold
+        predictions = [(3, 10, 16, 24), (4, 13, 15, 27)]
+        ground_truths = [(0, 13, 16, 28), (0, 13, 17, 29)]
+        hungarian = match_boxes(predictions, ground_truths, method='hungarian', pixel_offset=0)
+        assert hungarian['matches'].tolist() == [[0, 0], [1, 1]]
+
+    def test_estimate_skew_angle(self):
+        image = np.full((400, 600, 3), 255, dtype=np.uint8)
+        for y in range(40, 380, 30):
+            cv2.putText(image, 'Lorem ipsum dolor sit amet', (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+        skewed = fix_skew(image, 7.5)
+        assert abs(estimate_skew_angle(skewed) + 7.5) <= 0.2
+        angle = get_skew_angel([{'detected_object': skewed, 'label': 'a'}] * 2, workers=2)
+        assert abs(angle + 7.5) <= 0.2
+        with pytest.raises(ValueError):
+            get_skew_angel([{'detected_object': skewed, 'label': 'a'}], method='exhaustve')
+
+    def test_get_image_size(self):
+        for file in os.listdir(source_20):
+            image = cv2.imread(os.path.join(source_20, file), 0)
+            assert get_image_size(os.path.join(source_20, file)) == (image.shape[1], image.shape[0])
+        os.makedirs(target_20, exist_ok=True)
+        image = np.zeros((40, 70, 3), dtype=np.uint8)
+        for extension in ['png', 'bmp', 'tiff', 'webp']:
+            cv2.imwrite(os.path.join(target_20, f'image.{extension}'), image)
+            assert get_image_size(os.path.join(target_20, f'image.{extension}')) == (70, 40)
+        with open(os.path.join(target_20, 'invalid.jpg'), 'w') as f:
+            f.write('invalid')
+        assert get_image_size(os.path.join(target_20, 'invalid.jpg')) is None
+        shutil.rmtree(target_20)
+
+    def test_filter_dataset_by_dimension_cache(self):
+        cache_path = './data/sizes.json'
+        filter_images_by_dimension(source_20, target_20, 150, 150, cache_path=cache_path)
+        filter_images_by_dimension(source_20, target_20 + '_2', 150, 150, cache_path=cache_path)
+        assert sum(len(files) for _, _, files in os.walk(target_20 + '_2')) == 6
+        with open(cache_path) as f:
+            assert len(json.load(f)) == 10
+        for path in [target_20, target_20 + '_2']:
+            shutil.rmtree(path)
+        os.remove(cache_path)
+
+    def test_match_template(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, (200, 300, 3), dtype=np.uint8)
+        assert match_template(image[50:90, 120:180], image)
+        assert not match_template(rng.integers(0, 255, (40, 60, 3), dtype=np.uint8), image)
+
+    def test_template_bank(self):
+        rng = np.random.default_rng(0)
+        image = rng.integers(0, 255, (200, 300, 3), dtype=np.uint8)
+        templates = {'a': image[50:90, 120:180], 'b': image[10:40, 10:50],
+                     'c': rng.integers(0, 255, (40, 60, 3), dtype=np.uint8),
+                     'large': rng.integers(0, 255, (300, 400), dtype=np.uint8)}
+        for workers in [None, 4]:
+            matches = TemplateBank(templates, scales=(0.9, 1.0), workers=workers).match(image)
+            assert matches['a']['location'] == (120, 50) and matches['a']['scale'] == 1.0
+            assert matches['a']['score'] > 0.99 and matches['a']['size'] == (60, 40)
+            assert matches['b']['location'] == (10, 10)
+            assert matches['c']['score'] < 0.5
+            assert matches['large'] is None
+        bank = TemplateBank(templates)
+        assert list(bank.match(image, threshold=0.9, early_exit=True)) == ['a']
+        assert bank.best_match(image)[0] in ['a', 'b']
+        assert bank.best_match(image[100:, 200:]) is None
+
+    def test_get_objects(self):
+        image = np.random.default_rng(0).integers(1, 255, (400, 600, 3), dtype=np.uint8)
+        boxes = np.array([[100, 50, 200, 120], [300.7, 200.2, 450.9, 390.5], [-20, -10, 40, 30], [590, 390, 700, 500]])
+        objects = get_objects(image, boxes, labels=['a', 'b', 'c', 'd'])
+        for box, obj in zip(boxes[:2], objects[:2]):
+            expected = get_object(image, box, obj['label'])['detected_object']
+            assert np.array_equal(obj['detected_object'], expected)
+            assert np.shares_memory(obj['detected_object'], image)
+        assert objects[2]['detected_object'].shape == (33, 43, 3)
+        assert objects[3]['detected_object'].shape == (12, 12, 3)
+        packed = get_objects(image, boxes, pack=True)
+        assert packed['batch'].shape == (4, 195, 155, 3)
+        assert packed['sizes'].tolist() == [[75, 105], [195, 155], [33, 43], [12, 12]]
+        assert np.array_equal(packed['batch'][1], objects[1]['detected_object'])
+        assert not packed['batch'][2, 33:].any()
+        resized = get_objects(image, boxes, pack=True, size=(32, 16))
+        assert resized['batch'].shape == (4, 16, 32, 3) and resized['sizes'].tolist() == [[16, 32]] * 4
+        assert get_objects(image, np.empty((0, 4)), pack=True)['batch'].shape == (0, 0, 0, 3)
+
+    def test_apply_bbox_paddings(self):
+        page_dim = (0, 0, 600, 800)
+        bboxes = np.array([[10, 20, 100, 200], [0, 0, 600, 800]])
+        padded = apply_bbox_paddings(page_dim, bboxes, -0.01, -0.01, 0.01, 0.01)
+        for bbox, expected in zip(bboxes, padded):
+            assert np.allclose(apply_bbox_padding(page_dim, bbox, -0.01, -0.01, 0.01, 0.01), expected)
+        clipped = apply_bbox_paddings(page_dim, bboxes, -0.01, -0.01, 0.01, 0.01, clip=True)
+        assert clipped[1].tolist() == [0, 0, 600, 800]
+
+    def test_image_writer(self):
+        image = np.random.default_rng(0).integers(0, 256, (32, 48, 3), dtype=np.uint8)
+        assert np.array_equal(decode_image(encode_image(image, 'png', compression=9)), image)
+        assert np.array_equal(decode_image(encode_image(image, 'npy')), image)
+        assert len(encode_image(image, 'jpg', quality=10)) < len(encode_image(image, 'jpg', quality=100))
+        target_path = './data/image_writer'
+        os.makedirs(target_path, exist_ok=True)
+        try:
+            with ImageWriter('png', workers=2, max_pending=1) as writer:
+                futures = [writer.submit(os.path.join(target_path, str(i)), image) for i in range(8)]
+            assert [future.result() for future in futures] == [os.path.join(target_path, f'{i}.png') for i in range(8)]
+            assert sorted(os.listdir(target_path)) == sorted(f'{i}.png' for i in range(8))
+            assert writer.bytes_written == sum(os.path.getsize(future.result()) for future in futures)
+        finally:
+            shutil.rmtree(target_path)
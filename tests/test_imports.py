@@ -0,0 +1,33 @@
+import json
+import os
+import subprocess
+import sys
+
+import mlutils
+
+HEAVY_MODULES = ['albumentations', 'cv2', 'fitz', 'pandas', 'scipy', 'termtables', 'tqdm', 'yaml']
+
+
+def _imported_modules(code):
+    # a fresh interpreter, modules imported by the test session would hide eager imports
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(mlutils.__file__)))
+    script = f'import sys\n{code}\nimport json\nprint(json.dumps(sorted(sys.modules)))'
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True, env=env)
+    modules = set(json.loads(output.stdout.splitlines()[-1]))
+    return [name for name in HEAVY_MODULES if name in modules]
+
+
+class TestImports:
+    def test_import_package(self):
+        assert _imported_modules('import mlutils.data, mlutils.image, mlutils.pdf, mlutils.file') == []
+
+    def test_import_modules(self):
+        code = 'import mlutils.data.augmentation, mlutils.data.filter, mlutils.image.yolov5, ' \
+               'mlutils.image.cv_helper, mlutils.image.utils, mlutils.pdf.digital_pdf_helper, mlutils.file.utils'
+        assert _imported_modules(code) == []
+
+    def test_import_on_first_use(self):
+        code = 'import numpy as np\nfrom mlutils.image.cv_helper import match_boxes\n' \
+               'match_boxes(np.zeros((1, 4)), np.zeros((1, 4)), method="hungarian")'
+        assert _imported_modules(code) == ['scipy']
+        assert _imported_modules('from mlutils.data import split_data\nsplit_data(list(range(10)), 0.7, 0.3)') == []
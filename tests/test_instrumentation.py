@@ -0,0 +1,68 @@
+import io
+import os
+import shutil
+
+import albumentations as A
+
+from mlutils import instrumentation
+from mlutils.data.augmentation import Augmentation
+from mlutils.data.labels import read_label_dir
+from mlutils.file.utils import copy_file
+
+source_path = './data/augmentation/dataset'
+label_path = './data/augmentation/labels'
+target_path = './data/instrumentation_target'
+
+transform = A.Compose([A.HorizontalFlip()], bbox_params=A.BboxParams(format='yolo', label_fields=['class_labels']))
+
+
+class TestInstrumentation:
+    def teardown_method(self):
+        instrumentation.disable()
+        instrumentation.reset()
+        if os.path.exists(target_path):
+            shutil.rmtree(target_path)
+
+    def test_disabled(self):
+        with instrumentation.stage('test.stage'):
+            instrumentation.count('test.counter')
+        assert instrumentation.summary() == {'stages': {}, 'counters': {}}
+
+    def test_stages_counters_and_hooks(self):
+        events = []
+        with instrumentation.profile(hook=events.append):
+            for _ in range(3):
+                with instrumentation.stage('test.stage'):
+                    instrumentation.count('test.counter', 2)
+        summary = instrumentation.summary()
+        assert summary['stages']['test.stage']['calls'] == 3
+        assert summary['counters'] == {'test.counter': 6}
+        assert [event['type'] for event in events] == ['count', 'stage'] * 3
+        assert events[0]['value'] == 2
+        report = io.StringIO()
+        instrumentation.report(report)
+        assert 'test.stage' in report.getvalue() and 'test.counter' in report.getvalue()
+
+    def test_instrumented_operations(self):
+        with instrumentation.profile():
+            read_label_dir(label_path)
+            copy_file(source_path, target_path)
+            copy_file(source_path, target_path)
+        summary = instrumentation.summary()
+        assert summary['stages']['labels.read_label_dir']['calls'] == 1
+        assert summary['stages']['file.transfer_files']['calls'] == 2
+        assert summary['counters']['labels.files'] == 3
+        assert summary['counters']['file.copy'] == summary['counters']['file.skip'] == 3
+        assert summary['counters']['file.bytes_copied'] == sum(
+            os.path.getsize(os.path.join(source_path, file)) for file in os.listdir(source_path))
+
+    def test_augmentation_workers(self):
+        config = {'transform': transform, 'multiplier': 2, 'source_path': source_path, 'label_path': label_path,
+                  'target_path': target_path, 'workers': 2, 'chunk_size': 1}
+        with instrumentation.profile():
+            Augmentation(config).augment_images()
+        summary = instrumentation.summary()
+        assert summary['counters']['augmentation.images'] == 3
+        assert summary['counters']['augmentation.samples'] == 6
+        assert summary['stages']['augmentation.write_image']['calls'] == 6
+        assert summary['stages']['augmentation.read_image']['calls'] == 3
@@ -1,6 +1,11 @@
+import os
 import pickle
+import shutil
 
-from mlutils.pdf.digital_pdf_helper import PDFHelper
+import numpy as np
+
+from mlutils.pdf.cache import PDFCache, RenderCache
+from mlutils.pdf.digital_pdf_helper import PDFHelper, extract_documents
 
 pdf_obj = PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf')
 form_field_pdf_obj = PDFHelper('./data/pdf/01ArtisanBilingual(11_19_2021).pdf')
@@ -65,4 +70,84 @@ class TestPDFHelper:
         try:
             fields = form_field_pdf_obj.get_form_fields_by_page(page_no=1)
         except IndexError:
-            assert True
\ No newline at end of file
+            assert True
+
+    def test_lazy_pdf_helper(self):
+        lazy_pdf_obj = PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf', lazy=True)
+        assert lazy_pdf_obj.get_attributes_by_page(page_no=12) == pdf_obj.get_attributes_by_page(page_no=12)
+        assert lazy_pdf_obj.get_bbox_by_text(text='ALEX VIGIL', page_no=0) == pdf_obj.get_bbox_by_text(
+            text='ALEX VIGIL', page_no=0)
+        assert lazy_pdf_obj.metadata == pdf_obj.metadata
+        assert len(lazy_pdf_obj.get_images_by_page(page_no=4)) == 2
+
+    def test_find_pages_by_texts(self):
+        page_numbers = pdf_obj.find_pages_by_texts(['07/10/2021', 'ALEX'])
+        assert page_numbers == {'07/10/2021': [4, 5, 7, 8, 10, 11], 'ALEX': None}
+
+    def test_get_bboxes_by_texts(self):
+        bboxes = pdf_obj.get_bboxes_by_texts(['ALEX VIGIL', 'ALEX VIGILI'], page_no=0)
+        assert bboxes == {'ALEX VIGIL': (((92.000732421875, 165.1520233154297, 141.9416961669922,
+                                           174.1520233154297), 0),),
+                          'ALEX VIGILI': ()}
+
+    def test_extract_documents(self):
+        with open('./data/pdf/01ArtisanBilingual(01_10_2022).pdf', 'rb') as stream:
+            results = extract_documents(['./data/pdf/ALLIANCE_APP_Alex Vigil.pdf', stream, './data/pdf/missing.pdf'],
+                                        workers=2, max_pending=1)
+        assert [x['index'] for x in results] == [0, 1, 2]
+        assert results[0]['error'] is None
+        assert results[0]['spans'][12] == pdf_obj.get_attributes_by_page(page_no=12)
+        assert len(results[0]['images'][4]) == 2
+        assert results[1]['source'] is None and results[1]['page_count'] > 0
+        assert results[2]['error'] is not None
+
+    def test_pdf_cache(self):
+        cache = PDFCache('./data/pdf_cache')
+        try:
+            first = PDFHelper('./data/pdf/01ArtisanBilingual(11_19_2021).pdf', cache=cache)
+            with open('./data/pdf/01ArtisanBilingual(11_19_2021).pdf', 'rb') as stream:
+                second = PDFHelper(stream, cache=cache)
+            assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 0}
+            assert first.content_hash == second.content_hash
+            assert second.metadata == form_field_pdf_obj.metadata
+            assert second.get_form_fields_by_page(page_no=0) == form_field_pdf_obj.get_form_fields_by_page(page_no=0)
+        finally:
+            shutil.rmtree('./data/pdf_cache')
+
+    def test_pdf_cache_eviction(self):
+        cache = PDFCache('./data/pdf_cache', max_size=1)
+        try:
+            PDFHelper('./data/pdf/01ArtisanBilingual(11_19_2021).pdf', cache=cache)
+            assert cache.evictions == 1
+            assert os.listdir('./data/pdf_cache') == []
+        finally:
+            shutil.rmtree('./data/pdf_cache')
+
+    def test_render_page(self):
+        pdf = PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf')
+        rect = pdf.doc[0].rect
+        page = pdf.render_page(0, dpi=72)
+        assert page.shape == (round(rect.height), round(rect.width), 3) and page.dtype == np.uint8
+        assert not page.flags.writeable
+        assert pdf.render_page(0, dpi=72) is page
+        assert np.array_equal(pdf.render_page(0, dpi=72, color_order='bgr'), page[..., ::-1])
+        assert pdf.render_page(0, dpi=72, grayscale=True).shape == page.shape[:2]
+        bbox = pdf.get_bbox_by_text('ALEX VIGIL', page_no=0)[0][0]
+        crop = pdf.render_page(0, dpi=144, clip=bbox)
+        assert abs(crop.shape[1] - (bbox[2] - bbox[0]) * 2) <= 2 and abs(crop.shape[0] - (bbox[3] - bbox[1]) * 2) <= 2
+
+    def test_render_pages(self):
+        cache = RenderCache()
+        pdf = PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf', render_cache=cache)
+        pages = pdf.render_pages([0, 1, 2, 3], dpi=50, workers=2)
+        serial = PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf').render_pages([0, 1, 2, 3], dpi=50)
+        assert all(np.array_equal(a, b) for a, b in zip(pages, serial))
+        # another instance of the same document hits the shared cache
+        with open('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf', 'rb') as stream:
+            again = PDFHelper(stream, lazy=True, render_cache=cache).render_pages([3, 0], dpi=50)
+        assert again[0] is pages[3] and again[1] is pages[0]
+        assert cache.hits == 2 and len(cache) == 4
+        small = RenderCache(max_size=pages[0].nbytes)
+        PDFHelper('./data/pdf/ALLIANCE_APP_Alex Vigil.pdf', lazy=True, render_cache=small).render_pages(
+            [0, 1], dpi=50, workers=1)
+        assert len(small) == 1 and small.evictions == 1
@@ -1,5 +1,9 @@
-from mlutils.exceptions import DirectoryNotFound, FileNotFound
-from mlutils.image.yolov5 import read_label_classes, split_dataset_by_labels, dataset_summary
+import numpy as np
+import pytest
+
+from mlutils.exceptions import DirectoryNotFound, FileNotFound, UnsupportedObjectType
+from mlutils.image.yolov5 import get_detection_arrays, get_bbox_by_label, read_label_classes, index_dataset, \
+    split_dataset_by_labels, dataset_summary
 
 target_20 = './data/target_20'
 source_20 = './data/source_20'
@@ -36,3 +40,39 @@ class TestYoloV5:
         y = {'class1': {'3.jpeg'}, 'class2': {'3.jpeg', '1.jpeg'}, 'class3': {'2.jpeg', '1.jpeg'},
              'class4': {'3.jpeg', '2.jpeg'}}
         assert x == y
+
+    def test_index_dataset(self):
+        x = index_dataset(image_path='data/yolov5_dataset/train/images',
+                          annotation_path='data/yolov5_dataset/train/labels/')
+        assert sorted(x) == ['1.jpeg', '2.jpeg', '3.jpeg']
+        assert x['1.jpeg'].tolist() == [1, 2]
+
+    def test_summary_instances(self, capsys):
+        dataset_summary(data_file='data/yolov5_dataset/data.yaml', instances=True)
+        output = capsys.readouterr().out
+        assert 'Train Instances' in output
+        assert 'class4' in output
+
+    def test_get_detection_arrays(self):
+        detections, names = get_detection_arrays(Detections())
+        assert len(detections) == 2
+        assert detections[0]['label'].tolist() == [1, 0]
+        assert detections[0]['bbox'][0].tolist() == [10.0, 20.0, 30.0, 40.0]
+        assert names[detections[0]['label']].tolist() == ['class2', 'class1']
+        assert len(detections[1]) == 0
+
+    def test_get_bbox_by_label(self):
+        x = get_bbox_by_label(Detections())
+        assert x == [[('class2', 1, (10.0, 20.0, 30.0, 40.0), 0.75), ('class1', 0, (0.0, 0.0, 5.0, 5.0), 0.5)], []]
+
+    def test_get_bbox_by_label_invalid(self):
+        with pytest.raises(UnsupportedObjectType):
+            get_bbox_by_label([1])
+
+
+class Detections:
+    names = {0: 'class1', 1: 'class2'}
+    xyxy = [np.array([[10, 20, 30, 40, 0.75, 1], [0, 0, 5, 5, 0.5, 0]]), np.zeros((0, 6))]
+
+    def __len__(self):
+        return len(self.xyxy)